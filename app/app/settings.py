@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework',
     'rest_framework.authtoken',
@@ -47,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,13 +81,31 @@ WSGI_APPLICATION = 'app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# core.backends.postgresql adds CONN_HEALTH_CHECKS and POOL to Django's
+# backend. DB_POOL_MAX_SIZE above 0 turns the in-process pool on, for
+# threaded or ASGI workers; pooled connections go back to the pool after
+# each request instead of persisting in their thread for CONN_MAX_AGE.
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        'CONN_MAX_AGE': (
+            0 if DB_POOL_MAX_SIZE
+            else int(os.environ.get('DB_CONN_MAX_AGE', 60))
+        ),
+        'CONN_HEALTH_CHECKS': (
+            os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1'
+        ),
+        'POOL': {
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 0)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
     }
 }
 
@@ -137,8 +157,77 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# Local memory by default; set CACHE_BACKEND / CACHE_LOCATION to share
+# the caches below between processes (e.g. memcached).
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+}
+
+# Per-user cache of list responses, see recipe.cache.
+# A timeout of 0 disables it.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Cache of serialized recipes, see recipe.cache.FragmentCache.
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Resized copies of uploaded recipe images, see recipe.images. They are
+# generated after upload by IMAGE_VARIANT_WORKERS threads (0 = inline).
+# Formats this Pillow build cannot write are skipped and reported by
+# the recipe.W001 system check.
+IMAGE_VARIANT_SIZES = [128, 512, 1024]
+IMAGE_VARIANT_FORMATS = ['webp', 'jpeg']
+IMAGE_VARIANT_WORKERS = 2
+
+# Response compression, see core.middleware.CompressionMiddleware.
+# Encodings in order of preference; br and zstd are only used when the
+# brotli and zstandard packages are installed. HTML is left out: admin
+# and browsable API pages carry CSRF tokens, which compression would
+# expose to BREACH.
+COMPRESSION_ENCODINGS = ['br', 'zstd', 'gzip']
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_CONTENT_TYPES = [
+    'application/json',
+    'application/msgpack',
+    'application/cbor',
+    'application/x-ndjson',
+    'text/csv',
+    'application/vnd.oai.openapi',
+    'application/vnd.oai.openapi+json',
+]
+
+# Token authentication cache, see user.authentication.
+# Token lookups are cached in the shared cache for TOKEN_AUTH_CACHE_TIMEOUT
+# seconds and in a per-process LRU for TOKEN_AUTH_LOCAL_CACHE_TIMEOUT.
+TOKEN_AUTH_CACHE_ALIAS = 'default'
+TOKEN_AUTH_CACHE_TIMEOUT = 300
+TOKEN_AUTH_LOCAL_CACHE_SIZE = 1024
+TOKEN_AUTH_LOCAL_CACHE_TIMEOUT = 30
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # orjson backed JSON, and MessagePack or CBOR for clients that ask
+    # for them.
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'core.renderers.MessagePackRenderer',
+        'core.renderers.CBORRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.FastJSONParser',
+        'core.parsers.MessagePackParser',
+        'core.parsers.CBORParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
@@ -0,0 +1,59 @@
+"""
+Production settings for app project.
+
+Use with DJANGO_SETTINGS_MODULE=app.settings_production. Everything not
+set here comes from app.settings.
+
+The API authenticates with tokens only, so sessions, CSRF, messages and
+the authentication middleware only run outside /api/, for the admin.
+"""
+import os
+
+from app.settings import *  # noqa: F401,F403
+from app.settings import REST_FRAMEWORK
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+    if host.strip()
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'core.middleware.PathScopedMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+# Middleware run by core.middleware.PathScopedMiddleware, except for
+# requests under SCOPED_MIDDLEWARE_EXCLUDE.
+SCOPED_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+]
+SCOPED_MIDDLEWARE_EXCLUDE = ['/api/']
+
+# The admin and CSRF checks look for their middleware in MIDDLEWARE only.
+SILENCED_SYSTEM_CHECKS = [
+    'admin.E408', 'admin.E409', 'admin.E410', 'security.W003',
+]
+
+# Without sessions under /api/, only tokens can authenticate there, and
+# the browsable API (which needs sessions and CSRF to be usable) is off.
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'user.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+}
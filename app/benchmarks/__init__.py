@@ -0,0 +1,29 @@
+"""
+Benchmarks for the recipe API.
+
+Each module is a standalone script run from the app directory against the
+configured database, for example:
+
+    docker compose run --rm app sh -c "python -m benchmarks.query_plans"
+"""
+import os
+import time
+
+import django
+
+
+def setup():
+    """ Configure Django so benchmarks can use the ORM """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    django.setup()
+
+
+def timed(func, repeat=5):
+    """ Return the best wall time of calling func, in milliseconds """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,142 @@
+"""
+Measure tag/ingredient autocomplete latency on a large ingredient table.
+
+Seeds ingredient rows inside a transaction, calls the autocomplete
+endpoint for prefix and misspelled queries, prints latency percentiles
+and the query plans, then rolls everything back:
+
+    python -m benchmarks.autocomplete --rows 1000000 --users 10
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+
+setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from rest_framework.test import (  # noqa: E402
+    APIRequestFactory,
+    force_authenticate,
+)
+
+from core.models import Ingredient, name_prefix_key  # noqa: E402
+from recipe.views import IngredientViewSet  # noqa: E402
+
+WORDS = [
+    'apple', 'basil', 'butter', 'carrot', 'cheddar', 'chicken', 'chili',
+    'cinnamon', 'garlic', 'ginger', 'lemon', 'lentil', 'mushroom', 'onion',
+    'oregano', 'paprika', 'parsley', 'pepper', 'potato', 'rice', 'salmon',
+    'spinach', 'tomato', 'turmeric', 'vanilla', 'yogurt',
+]
+
+QUERIES = [
+    ('prefix', 't'),
+    ('prefix', 'to'),
+    ('prefix', 'tom'),
+    ('prefix', 'tomato 12'),
+    ('fuzzy', 'tomatoe'),
+    ('fuzzy', 'cinamon'),
+    ('fuzzy', 'parsely'),
+]
+
+
+def seed(cursor, rows, users):
+    """ Bulk insert ingredient rows and return the first user id """
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    cursor.execute(
+        """
+        WITH inserted AS (
+            INSERT INTO core_user (
+                email, name, password, date_joined, last_login,
+                is_active, is_staff, is_superuser
+            )
+            SELECT 'bench' || g || '@example.com', '', '!', now(), now(),
+                true, false, false
+            FROM generate_series(1, %s) g
+            RETURNING id
+        )
+        SELECT min(id) FROM inserted
+        """,
+        [users],
+    )
+    first_user = cursor.fetchone()[0]
+    cursor.execute(
+        """
+        INSERT INTO core_ingredient (user_id, name, updated_at)
+        SELECT %s + g %% %s, (%s::text[])[1 + g %% %s] || ' ' || g, now()
+        FROM generate_series(1, %s) g
+        """,
+        [first_user, users, WORDS, len(WORDS), rows],
+    )
+    cursor.execute('ANALYZE core_ingredient')
+    return first_user
+
+
+def measure(view, user, query, repeat):
+    """ Return per-call latencies in milliseconds and the last response """
+    factory = APIRequestFactory()
+    latencies = []
+    for _ in range(repeat):
+        request = factory.get('/', {'q': query, 'limit': 10})
+        force_authenticate(request, user=user)
+        start = time.perf_counter()
+        response = view(request)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, response
+
+
+def percentile(values, pct):
+    """ Return the pct percentile of values """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def explain(user, query):
+    """ Print the plans of the prefix and trigram queries """
+    queryset = Ingredient.objects.filter(user=user).only('id', 'name')
+    prefix = queryset.alias(key=name_prefix_key()).filter(
+        key__startswith=query.upper(),
+    ).order_by('key')[:10]
+    fuzzy = queryset.filter(name__trigram_similar=query)[:10]
+    for label, plan_queryset in [('prefix', prefix), ('trigram', fuzzy)]:
+        print(f'--- {label} plan for {query!r}')
+        print(plan_queryset.explain(analyze=True))
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    view = IngredientViewSet.as_view({'get': 'autocomplete'})
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            first_user = seed(cursor, args.rows, args.users)
+        user = get_user_model().objects.get(pk=first_user)
+        per_user = args.rows // args.users
+        print(f'{args.rows} ingredients, ~{per_user} for the queried user')
+        print(f'{"mode":<8}{"query":<12}{"p50 ms":>9}{"p95 ms":>9}'
+              f'{"max ms":>9}{"hits":>6}')
+        for mode, query in QUERIES:
+            latencies, response = measure(view, user, query, args.repeat)
+            print(
+                f'{mode:<8}{query:<12}'
+                f'{statistics.median(latencies):>9.2f}'
+                f'{percentile(latencies, 95):>9.2f}'
+                f'{max(latencies):>9.2f}'
+                f'{len(response.data):>6}'
+            )
+        print()
+        explain(user, 'tom')
+        explain(user, 'tomatoe')
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare payload size and encode/decode time of JSON, MessagePack and
+CBOR on recipe list payloads.
+
+Uses the payloads of benchmarks.json_renderers (no database needed) and
+the API's own renderers and parsers:
+
+    python -m benchmarks.binary_formats --sizes 1000 10000
+"""
+import argparse
+from io import BytesIO
+
+from benchmarks import setup, timed
+
+setup()
+
+from core.parsers import (  # noqa: E402
+    CBORParser,
+    FastJSONParser,
+    MessagePackParser,
+)
+from core.renderers import (  # noqa: E402
+    CBORRenderer,
+    FastJSONRenderer,
+    MessagePackRenderer,
+)
+from benchmarks.json_renderers import payload  # noqa: E402
+
+FORMATS = [
+    ('json', FastJSONRenderer(), FastJSONParser()),
+    ('msgpack', MessagePackRenderer(), MessagePackParser()),
+    ('cbor', CBORRenderer(), CBORParser()),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f'{"format":8} {"recipes":>7} {"KiB":>10} {"vs json":>8} '
+        f'{"encode ms":>10} {"decode ms":>10}'
+    )
+    for size in args.sizes:
+        data = payload(size)
+        json_size = None
+        for name, renderer, format_parser in FORMATS:
+            body = renderer.render(data)
+            json_size = json_size or len(body)
+            encode = timed(lambda: renderer.render(data), args.repeat)
+            decode = timed(
+                lambda: format_parser.parse(BytesIO(body)), args.repeat,
+            )
+            print(
+                f'{name:8} {size:>7} {len(body) / 1024:10.1f} '
+                f'{len(body) / json_size:8.0%} {encode:10.1f} {decode:10.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
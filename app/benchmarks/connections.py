@@ -0,0 +1,113 @@
+"""
+Load test the database connection settings: a new connection per
+request, persistent connections with health checks, and the in-process
+pool.
+
+Worker threads run simulated requests, each sending request_started,
+running one small query and sending request_finished, just as Django
+does around a view. Prints the latency percentiles and throughput of
+each setting, and the pool's wait times:
+
+    python -m benchmarks.connections --threads 8 --requests 500
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from benchmarks import setup
+
+setup()
+
+from django.core.signals import (  # noqa: E402
+    request_finished,
+    request_started,
+)
+from django.db import connection, connections  # noqa: E402
+
+from core.backends.postgresql.pool import pool_stats  # noqa: E402
+
+
+def modes(pool_size):
+    return [
+        ('per request', {'CONN_MAX_AGE': 0, 'POOL': {}}),
+        ('persistent', {
+            'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+            'POOL': {},
+        }),
+        ('pool', {
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+            'POOL': {'MAX_SIZE': pool_size, 'TIMEOUT': 10},
+        }),
+    ]
+
+
+def worker(requests, latencies):
+    """ Run simulated requests, appending their latencies in ms """
+    for _ in range(requests):
+        start = time.perf_counter()
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM core_tag')
+            cursor.fetchone()
+        request_finished.send(sender=None)
+        latencies.append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+
+
+def run(threads, requests):
+    """ Return the request latencies and the elapsed time in seconds """
+    latencies = []
+    workers = [
+        threading.Thread(target=worker, args=(requests, latencies))
+        for _ in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument(
+        '--pool-size', type=int, default=4,
+        help='pool size, below --threads to show waiting',
+    )
+    args = parser.parse_args()
+
+    base = connections.databases['default']
+    print(
+        f'{"mode":12} {"p50 ms":>7} {"p95 ms":>7} {"p99 ms":>7} '
+        f'{"req/s":>8}'
+    )
+    for name, overrides in modes(args.pool_size):
+        # Threads create their connections from these settings.
+        connections.databases['default'] = {**base, **overrides}
+        latencies, elapsed = run(args.threads, args.requests)
+        cuts = statistics.quantiles(latencies, n=100)
+        print(
+            f'{name:12} {cuts[49]:7.2f} {cuts[94]:7.2f} {cuts[98]:7.2f} '
+            f'{len(latencies) / elapsed:8.0f}'
+        )
+    connections.databases['default'] = base
+
+    for alias, stats in pool_stats().items():
+        mean = stats['wait_seconds'] / stats['acquired'] * 1000
+        print(
+            f'\npool {alias!r}: {stats["acquired"]} acquired, '
+            f'{stats["created"]} connections opened, '
+            f'{stats["waited"]} waited, mean wait {mean:.3f} ms, '
+            f'max wait {stats["max_wait_seconds"] * 1000:.2f} ms, '
+            f'{stats["timeouts"]} timeouts'
+        )
+
+
+if __name__ == '__main__':
+    main()
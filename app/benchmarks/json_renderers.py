@@ -0,0 +1,110 @@
+"""
+Compare the stdlib and orjson JSON renderers and parsers on large recipe
+list payloads.
+
+Builds payloads shaped like the recipe list response (no database
+needed), renders and parses them with both implementations and prints
+the best time, throughput and peak memory allocated:
+
+    python -m benchmarks.json_renderers --sizes 1000 10000 50000
+"""
+import argparse
+import tracemalloc
+from collections import OrderedDict
+from io import BytesIO
+
+from benchmarks import setup, timed
+
+setup()
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from core.parsers import FastJSONParser  # noqa: E402
+from core.renderers import FastJSONRenderer  # noqa: E402
+
+
+def payload(size):
+    """ Return a recipe list representation with size recipes """
+    return [
+        OrderedDict([
+            ('id', i),
+            ('title', f'Recipe {i}'),
+            ('time_minutes', 30),
+            ('price', '5.50'),
+            ('link', f'https://example.com/recipes/{i}'),
+            ('tags', [
+                OrderedDict([('id', i * 3 + n), ('name', f'tag {n}')])
+                for n in range(3)
+            ]),
+            ('ingredients', [
+                OrderedDict([('id', i * 5 + n), ('name', f'ingrédient {n}')])
+                for n in range(5)
+            ]),
+            ('image_variants', {
+                '128': {'jpeg': f'/static/media/uploads/{i}-128.jpeg'},
+            }),
+            ('description', 'Mix everything, then bake. ' * 10),
+        ])
+        for i in range(size)
+    ]
+
+
+def peak_memory(func):
+    """ Return the peak memory func allocates, in MiB """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def report(label, size, func, body_size, repeat):
+    """ Print the timing, throughput and memory of one operation """
+    elapsed = timed(func, repeat)
+    throughput = body_size / 1024 / 1024 / (elapsed / 1000)
+    print(
+        f'{label:28} {size:>7} {elapsed:10.1f} {throughput:10.1f} '
+        f'{peak_memory(func):10.1f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f'{"operation":28} {"recipes":>7} {"ms":>10} {"MiB/s":>10} '
+        f'{"peak MiB":>10}'
+    )
+    for size in args.sizes:
+        data = payload(size)
+        body = JSONRenderer().render(data)
+        if FastJSONRenderer().render(data) != body:
+            raise AssertionError('Renderer output differs.')
+        for label, renderer in (
+            ('render JSONRenderer', JSONRenderer()),
+            ('render FastJSONRenderer', FastJSONRenderer()),
+        ):
+            report(
+                label, size, lambda: renderer.render(data), len(body),
+                args.repeat,
+            )
+        for label, json_parser in (
+            ('parse JSONParser', JSONParser()),
+            ('parse FastJSONParser', FastJSONParser()),
+        ):
+            report(
+                label, size,
+                lambda: json_parser.parse(BytesIO(body)),
+                len(body), args.repeat,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure the per-request overhead of the default middleware stack against
+the lean production stack that skips sessions, CSRF and messages under
+/api/.
+
+Creates a user and token inside a transaction, sends token authenticated
+API requests through the full Django request cycle with each stack,
+prints the mean latency per request and finally rolls everything back:
+
+    python -m benchmarks.middleware --requests 2000
+"""
+import argparse
+import os
+import time
+
+from benchmarks import setup
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import transaction  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark')
+from app import settings_production as production  # noqa: E402
+
+STACKS = [
+    ('default', {'MIDDLEWARE': settings.MIDDLEWARE}),
+    ('lean', {
+        'MIDDLEWARE': production.MIDDLEWARE,
+        'SCOPED_MIDDLEWARE': production.SCOPED_MIDDLEWARE,
+        'SCOPED_MIDDLEWARE_EXCLUDE': production.SCOPED_MIDDLEWARE_EXCLUDE,
+    }),
+]
+
+
+def measure(url, token, requests):
+    """ Return the mean latency of GET requests, in microseconds """
+    client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+    response = client.get(url)
+    if response.status_code != 200:
+        raise AssertionError(f'{url} answered {response.status_code}.')
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(url)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        user = get_user_model().objects.create_user(
+            email='bench-middleware@example.com',
+            password='benchmark',
+        )
+        token = Token.objects.create(user=user).key
+        urls = [reverse('user:me'), reverse('recipe:tag-list')]
+
+        print(f'{"url":24} {"stack":8} {"us/request":>11} {"saved":>9}')
+        print('(best of rounds, stacks alternating)')
+        for url in urls:
+            best = {}
+            for _ in range(args.rounds):
+                for name, overrides in STACKS:
+                    with override_settings(
+                        ALLOWED_HOSTS=['testserver'], **overrides
+                    ):
+                        latency = measure(url, token, args.requests)
+                    best[name] = min(best.get(name, latency), latency)
+            baseline = best[STACKS[0][0]]
+            for name, latency in best.items():
+                print(
+                    f'{url:24} {name:8} {latency:11.0f} '
+                    f'{baseline - latency:9.0f}'
+                )
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Show query plans for the hot per-user queries with and without the
+access path indexes.
+
+Seeds a large dataset inside a transaction, prints EXPLAIN ANALYZE for
+the queries the list endpoints run, drops the indexes added for those
+access paths, prints the plans again and finally rolls everything back:
+
+    python -m benchmarks.query_plans --users 1000 --recipes 2000000
+"""
+import argparse
+
+from benchmarks import setup
+
+setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from core.models import Tag  # noqa: E402
+from recipe.views import (  # noqa: E402
+    RecipeViewSet,
+    TagViewSet,
+)
+
+ACCESS_PATH_INDEXES = [
+    'DROP INDEX recipe_user_id_desc_idx',
+    'DROP INDEX recipe_tags_tag_recipe_idx',
+    'DROP INDEX recipe_ingredients_ingredient_recipe_idx',
+    'ALTER TABLE core_tag DROP CONSTRAINT unique_tag_name_per_user',
+    'ALTER TABLE core_ingredient '
+    'DROP CONSTRAINT unique_ingredient_name_per_user',
+]
+
+SEED_TABLES = [
+    ('core_tag', 'core_recipe_tags', 'tag_id'),
+    ('core_ingredient', 'core_recipe_ingredients', 'ingredient_id'),
+]
+
+
+def seed(cursor, users, recipes, names):
+    """ Bulk insert benchmark rows and return the first user id """
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    cursor.execute(
+        """
+        WITH inserted AS (
+            INSERT INTO core_user (
+                email, name, password, date_joined, last_login,
+                is_active, is_staff, is_superuser
+            )
+            SELECT 'bench' || g || '@example.com', '', '!', now(), now(),
+                true, false, false
+            FROM generate_series(1, %s) g
+            RETURNING id
+        )
+        SELECT min(id) FROM inserted
+        """,
+        [users],
+    )
+    first_user = cursor.fetchone()[0]
+    last_user = first_user + users - 1
+    cursor.execute(
+        """
+        INSERT INTO core_recipe (
+            user_id, title, description, time_minutes, price, link,
+            image_variants, updated_at
+        )
+        SELECT %s + g %% %s, 'Recipe ' || g, '', 30, 5.00, '', '{}', now()
+        FROM generate_series(1, %s) g
+        """,
+        [first_user, users, recipes],
+    )
+    for table, through, column in SEED_TABLES:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (user_id, name, updated_at)
+            SELECT u, 'name' || n, now()
+            FROM generate_series(%s, %s) u, generate_series(1, %s) n
+            """,
+            [first_user, last_user, names],
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {through} (recipe_id, {column})
+            SELECT r.id, t.id
+            FROM core_recipe r
+            JOIN {table} t
+                ON t.user_id = r.user_id
+                AND t.name = 'name' || (r.id %% %s + 1)
+            WHERE r.user_id BETWEEN %s AND %s
+            """,
+            [names, first_user, last_user],
+        )
+    cursor.execute('ANALYZE')
+    return first_user
+
+
+def list_queryset(viewset_class, user, **params):
+    """ Return the queryset a list request with params would run """
+    request = Request(APIRequestFactory().get('/', params))
+    request.user = user
+    view = viewset_class(request=request, action='list', format_kwarg=None)
+    return view.get_queryset()
+
+
+def hot_queries(user):
+    """ Return the labelled querysets to explain """
+    tag = Tag.objects.filter(user=user, recipe__isnull=False).first()
+    return [
+        ('recipe list', list_queryset(RecipeViewSet, user)[:50]),
+        (
+            'recipe list filtered by tag',
+            list_queryset(RecipeViewSet, user, tags=str(tag.id))[:50],
+        ),
+        ('tag list', list_queryset(TagViewSet, user)[:50]),
+        (
+            'assigned tag list',
+            list_queryset(TagViewSet, user, assigned_only=1)[:50],
+        ),
+    ]
+
+
+def explain_all(title, user):
+    """ Print EXPLAIN ANALYZE output for every hot query """
+    print(f'===== {title} =====')
+    for label, queryset in hot_queries(user):
+        print(f'--- {label}')
+        print(queryset.explain(analyze=True))
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=2000000)
+    parser.add_argument('--names', type=int, default=50)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            first_user = seed(cursor, args.users, args.recipes, args.names)
+        user = get_user_model().objects.get(pk=first_user)
+
+        explain_all('with access path indexes', user)
+        with connection.cursor() as cursor:
+            for statement in ACCESS_PATH_INDEXES:
+                cursor.execute(statement)
+            cursor.execute('ANALYZE')
+        explain_all('without access path indexes', user)
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare the recipe list serializers on model instances and on values()
+rows.
+
+Seeds recipes with tags and ingredients inside a transaction, renders
+the newest 100, 1000 and 10000 of them to JSON both ways (queries
+included, fragment cache off), checks the output is byte-identical,
+prints the timings and finally rolls everything back:
+
+    python -m benchmarks.serializers --sizes 100 1000 10000
+"""
+import argparse
+
+from benchmarks import setup, timed
+
+setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from benchmarks.query_plans import seed  # noqa: E402
+from core.models import Recipe  # noqa: E402
+from recipe.cache import fragment_cache  # noqa: E402
+from recipe.serializers import (  # noqa: E402
+    RecipeDetailSerializer,
+    RecipeSerializer,
+)
+
+
+def render(serializer_class, recipes):
+    """ Return the JSON bytes of a list of recipes """
+    return JSONRenderer().render(serializer_class(recipes, many=True).data)
+
+
+def compare(serializer_class, user, size, repeat):
+    """ Print the time of both paths for the newest size recipes """
+    columns = ['updated_at', *serializer_class().selected_columns()]
+    queryset = Recipe.objects.filter(user=user).order_by('-id')
+
+    def instances():
+        return render(serializer_class, queryset.only(*columns)[:size])
+
+    def rows():
+        return render(serializer_class, queryset.values(*columns)[:size])
+
+    if instances() != rows():
+        raise AssertionError('Row and instance output differ.')
+    slow = timed(instances, repeat)
+    fast = timed(rows, repeat)
+    print(
+        f'{serializer_class.__name__:24} {size:>6} '
+        f'{slow:10.1f} {fast:10.1f} {slow / fast:8.1f}x'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+    )
+    parser.add_argument('--names', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fragment_cache.timeout = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            first_user = seed(cursor, 1, max(args.sizes), args.names)
+        user = get_user_model().objects.get(pk=first_user)
+
+        print(
+            f'{"serializer":24} {"recipes":>6} {"instances":>10} '
+            f'{"rows":>10} {"speedup":>9}'
+        )
+        print('(best of runs, milliseconds)')
+        for serializer_class in (RecipeSerializer, RecipeDetailSerializer):
+            for size in args.sizes:
+                compare(serializer_class, user, size, args.repeat)
+
+        transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# PostgreSQL backend with connection health checks and pooling
+
+import functools
+
+from django.db.backends.postgresql import base
+
+from core.backends.postgresql.pool import ConnectionPool, get_pool
+
+Database = base.Database
+
+
+def ping(connection):
+    """ Return whether a raw connection still answers """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+def is_open(connection):
+    """ Return whether a raw connection was not closed, without a query """
+    return connection.closed == 0
+
+
+def reset(connection):
+    """ End any transaction left open, ready for the next user """
+    connection.rollback()
+    connection.autocommit = True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Django's PostgreSQL backend, plus two settings of the database:
+
+    CONN_HEALTH_CHECKS: check a persistent connection still works before
+    its first query of each request and reconnect if it doesn't, rather
+    than failing the request.
+
+    POOL: share connections between the threads of the process through
+    a ConnectionPool, given as {'MAX_SIZE': ..., 'MAX_OVERFLOW': ...,
+    'TIMEOUT': ...}. A connection is taken from the pool on connect and
+    returned to it on close, so with CONN_MAX_AGE = 0 each request holds
+    one only while it runs. Off unless MAX_SIZE is above 0.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return bool(self.settings_dict.get('CONN_HEALTH_CHECKS', False))
+
+    @property
+    def pool(self):
+        options = self.settings_dict.get('POOL') or {}
+        if options.get('MAX_SIZE', 0) <= 0:
+            return None
+        key = (self.alias, repr(sorted(self.get_connection_params().items())))
+        return get_pool(key, lambda: ConnectionPool(
+            max_size=options['MAX_SIZE'],
+            max_overflow=options.get('MAX_OVERFLOW', 0),
+            timeout=options.get('TIMEOUT', 10),
+            check=ping if self.health_check_enabled else is_open,
+            reset=reset,
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection, created = pool.acquire(
+            functools.partial(super().get_new_connection, conn_params)
+        )
+        if not created:
+            options = self.settings_dict['OPTIONS']
+            self.isolation_level = options.get(
+                'isolation_level', connection.isolation_level,
+            )
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps using the connection until the block exits.
+                pool.discard(self.connection)
+            else:
+                pool.release(self.connection)
+
+    def connect(self):
+        super().connect()
+        # A new connection needs no check until the next request.
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        """ Close the connection if it no longer works, once per request """
+        if (
+            self.connection is None or
+            not self.health_check_enabled or
+            self.health_check_done or
+            self.in_atomic_block
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
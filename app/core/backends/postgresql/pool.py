@@ -0,0 +1,177 @@
+# In-process pool of database connections
+
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    """ No connection became available within the acquire timeout """
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections.
+
+    Up to max_size connections are kept open; max_overflow more may be
+    opened under load and are closed when released. Acquiring waits up
+    to timeout seconds for a connection to be released once both are
+    exhausted. Idle connections are handed out most recently used first
+    and, when a check is given, only if they pass it. Released
+    connections are reset, or closed if that fails.
+
+    Wait times are recorded, see stats().
+    """
+
+    def __init__(
+        self, max_size, max_overflow=0, timeout=10.0, check=None,
+        reset=None,
+    ):
+        self.max_size = max_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.check = check
+        self.reset = reset
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+        self._stats = {
+            'acquired': 0,
+            'created': 0,
+            'closed': 0,
+            'waited': 0,
+            'wait_seconds': 0.0,
+            'max_wait_seconds': 0.0,
+            'timeouts': 0,
+        }
+
+    def acquire(self, connect):
+        """
+        Return (connection, created), calling connect() to open a new
+        connection when none is idle and the pool may grow.
+        """
+        started = time.monotonic()
+        while True:
+            connection = self._take(started)
+            waited = time.monotonic() - started
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self._forget()
+                    raise
+                self._record(waited, created=True)
+                return connection, True
+            if self.check is None or self.check(connection):
+                self._record(waited, created=False)
+                return connection, False
+            self.discard(connection)
+
+    def _take(self, started):
+        """
+        Pop an idle connection, or reserve room for a new one and return
+        None, waiting until the deadline for either.
+        """
+        deadline = started + self.timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size + self.max_overflow:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    logger.warning(
+                        'No database connection available after %.1fs '
+                        '(%d open).', self.timeout, self._size,
+                    )
+                    raise PoolTimeout(
+                        f'No database connection available within '
+                        f'{self.timeout}s.'
+                    )
+                self._condition.wait(remaining)
+
+    def release(self, connection):
+        """ Return a connection, keeping it if the pool is not over size """
+        try:
+            if self.reset is not None:
+                self.reset(connection)
+        except Exception:
+            self.discard(connection)
+            return
+        with self._condition:
+            if self._size <= self.max_size:
+                self._idle.append(connection)
+                self._condition.notify()
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        """ Close a connection and free its room in the pool """
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._forget()
+
+    def _forget(self):
+        with self._condition:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._condition.notify()
+
+    def _record(self, waited, created):
+        with self._condition:
+            stats = self._stats
+            stats['acquired'] += 1
+            if created:
+                stats['created'] += 1
+            if waited >= 0.001:
+                stats['waited'] += 1
+            stats['wait_seconds'] += waited
+            stats['max_wait_seconds'] = max(
+                stats['max_wait_seconds'], waited,
+            )
+
+    def stats(self):
+        """ Return the pool's counters and its current size """
+        with self._condition:
+            return {
+                **self._stats,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            }
+
+    def close_all(self):
+        """ Close every idle connection """
+        with self._condition:
+            idle = list(self._idle)
+            self._idle.clear()
+        for connection in idle:
+            self.discard(connection)
+
+
+def get_pool(key, factory):
+    """ Return the process wide pool for key, creating it on first use """
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = factory()
+        return _pools[key]
+
+
+def pool_stats():
+    """ Return {alias: stats} for every pool of this process """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {key[0]: pool.stats() for key, pool in pools}
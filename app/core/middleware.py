@@ -0,0 +1,267 @@
+# Middleware for the API
+
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCodec:
+    """ gzip with a fixed header, so equal bodies compress equally """
+    name = 'gzip'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return b''.join(self.compress_stream([data]))
+
+    def compress_stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+
+class BrotliCodec:
+    """ Brotli, at a quality fast enough for dynamic responses """
+    name = 'br'
+
+    def __init__(self, quality=5):
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def compress_stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.quality)
+        for chunk in chunks:
+            yield compressor.process(chunk)
+        yield compressor.finish()
+
+
+class ZstdCodec:
+    """ Zstandard """
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        self.compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def compress_stream(self, chunks):
+        compressor = self.compressor.compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.flush()
+
+
+def available_codecs():
+    """ Return {encoding: codec} for the encodings this install supports """
+    codecs = {'gzip': GzipCodec()}
+    if brotli is not None:
+        codecs['br'] = BrotliCodec()
+    if zstandard is not None:
+        codecs['zstd'] = ZstdCodec()
+    return codecs
+
+
+def parse_accept_encoding(header):
+    """ Return {encoding: q} from an Accept-Encoding header """
+    accepted = {}
+    for item in header.split(','):
+        encoding, *params = [part.strip() for part in item.split(';')]
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[encoding.lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with the best encoding the client accepts.
+
+    Only responses of the COMPRESSION_CONTENT_TYPES are compressed, and
+    buffered ones only from COMPRESSION_MIN_SIZE bytes. The client's
+    q-values decide between encodings, ties going to the first one of
+    COMPRESSION_ENCODINGS (brotli and zstd need their packages).
+    Responses that use the CSRF token are never compressed, since their
+    compressed size would leak it (BREACH).
+
+    Views can hand over precompressed bodies: a response with a
+    `load_compressed(encoding)` method is asked for one before
+    compressing, and one with `store_compressed(encoding, body)` is
+    given the body it was compressed to.
+    """
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        codecs = available_codecs()
+        self.codecs = [
+            codecs[name]
+            for name in getattr(
+                settings, 'COMPRESSION_ENCODINGS', ['br', 'zstd', 'gzip'],
+            )
+            if name in codecs
+        ]
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.content_types = set(getattr(
+            settings, 'COMPRESSION_CONTENT_TYPES', ['application/json'],
+        ))
+
+    def choose_codec(self, request):
+        """ Return the codec to answer a request with, or None """
+        accepted = parse_accept_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        best = None
+        best_quality = 0.0
+        for codec in self.codecs:
+            quality = accepted.get(codec.name, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = codec, quality
+        return best
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if (
+            request.META.get('CSRF_COOKIE_USED') or
+            settings.CSRF_COOKIE_NAME in response.cookies
+        ):
+            return response
+        content_type = response.get('Content-Type', '')
+        if content_type.split(';')[0].strip().lower() not in (
+            self.content_types
+        ):
+            return response
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codec = self.choose_codec(request)
+        if codec is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = (
+                data for data in codec.compress_stream(
+                    response.streaming_content,
+                )
+                if data
+            )
+            del response['Content-Length']
+        else:
+            load = getattr(response, 'load_compressed', None)
+            body = load(codec.name) if load else None
+            if body is None:
+                body = codec.compress(response.content)
+                store = getattr(response, 'store_compressed', None)
+                if store:
+                    store(codec.name, body)
+            if len(body) >= len(response.content):
+                return response
+            response.content = body
+            response['Content-Length'] = str(len(body))
+
+        # The compressed body is another representation of the resource.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = codec.name
+        return response
+
+
+class PathScopedMiddleware:
+    """
+    Run the SCOPED_MIDDLEWARE chain around requests, except those under
+    the SCOPED_MIDDLEWARE_EXCLUDE path prefixes, which go straight on.
+
+    This keeps sessions, CSRF and messages for the admin while token
+    authenticated API requests skip them. The scoped middleware's view,
+    exception and template response hooks are called in the order
+    Django would call them if they were listed in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.exclude = tuple(
+            getattr(settings, 'SCOPED_MIDDLEWARE_EXCLUDE', ['/api/'])
+        )
+        self.view_hooks = []
+        self.template_response_hooks = []
+        self.exception_hooks = []
+        handler = get_response
+        for path in reversed(getattr(settings, 'SCOPED_MIDDLEWARE', [])):
+            try:
+                middleware = import_string(path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_hooks.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_hooks.append(
+                    middleware.process_template_response
+                )
+            if hasattr(middleware, 'process_exception'):
+                self.exception_hooks.append(middleware.process_exception)
+            handler = middleware
+        self.scoped = handler
+
+    def is_excluded(self, request):
+        return request.path_info.startswith(self.exclude)
+
+    def __call__(self, request):
+        if self.is_excluded(request):
+            return self.get_response(request)
+        return self.scoped(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_excluded(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self.is_excluded(request):
+            for hook in self.template_response_hooks:
+                response = hook(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_excluded(request):
+            return None
+        for hook in self.exception_hooks:
+            response = hook(request, exception)
+            if response is not None:
+                return response
+        return None
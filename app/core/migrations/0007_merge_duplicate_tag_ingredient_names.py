@@ -0,0 +1,47 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """ Merge tags and ingredients sharing a name for the same user """
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field_name in [('Tag', 'tags'), ('Ingredient', 'ingredients')]:
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field_name).through
+        target = f'{model_name.lower()}_id'
+        duplicates = (
+            model.objects.values('user_id', 'name')
+            .annotate(keep_id=models.Min('id'), total=models.Count('id'))
+            .filter(total__gt=1)
+        )
+        for group in duplicates:
+            drop_ids = list(
+                model.objects.filter(user_id=group['user_id'], name=group['name'])
+                .exclude(id=group['keep_id'])
+                .values_list('id', flat=True)
+            )
+            linked = set(
+                through.objects.filter(**{target: group['keep_id']})
+                .values_list('recipe_id', flat=True)
+            )
+            moved = set(
+                through.objects.filter(**{f'{target}__in': drop_ids})
+                .values_list('recipe_id', flat=True)
+            )
+            through.objects.bulk_create([
+                through(recipe_id=recipe_id, **{target: group['keep_id']})
+                for recipe_id in moved - linked
+            ])
+            model.objects.filter(id__in=drop_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+    ]
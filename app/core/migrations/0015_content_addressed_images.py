@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:22
+
+import core.models
+from django.db import migrations, models
+
+
+def count_image_references(apps, schema_editor):
+    """ Create a blob row for every image already stored """
+    Recipe = apps.get_model('core', 'Recipe')
+    ImageBlob = apps.get_model('core', 'ImageBlob')
+    references = (
+        Recipe.objects.exclude(image='').exclude(image__isnull=True)
+        .values('image')
+        .annotate(total=models.Count('id'))
+    )
+    ImageBlob.objects.bulk_create(
+        ImageBlob(name=row['image'], refcount=row['total'])
+        for row in references.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=core.models.ContentAddressedImageField(null=True, upload_to=core.models.recipe_image_file_path),
+        ),
+        migrations.AddIndex(
+            model_name='imageblob',
+            index=models.Index(condition=models.Q(('refcount', 0)), fields=['updated_at'], name='imageblob_unreferenced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('image', ''), _negated=True), fields=['image'], name='recipe_image_idx'),
+        ),
+        migrations.RunPython(
+            count_image_references,
+            migrations.RunPython.noop,
+        ),
+    ]
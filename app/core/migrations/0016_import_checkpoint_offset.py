@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='offset',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -1,21 +1,77 @@
 """ database models """
 
-import uuid
+import hashlib
 import os
 from django.conf import settings
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.fields.files import ImageFieldFile
+from django.db.models.functions import Coalesce, Collate, Upper
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+SEARCH_CONFIG = 'english'
+
+
+def name_prefix_key():
+    """
+    Case-insensitive, byte-ordered key for tag and ingredient names. An
+    index on it serves both `LIKE 'PREFIX%'` and ordering by the key.
+    """
+    return Collate(Upper('name'), 'C')
+
+
 def recipe_image_file_path(instance, filename):
-    """ Generate file path for new recipe image """
-    ext = os.path.splitext(filename)[1]
-    filename = f'{uuid.uuid4()}{ext}'
+    """ Generate file path for new recipe image, sharded by its name """
+    return os.path.join('uploads', 'recipe', filename[:2], filename)
+
+
+class ContentAddressedFieldFile(ImageFieldFile):
+    """
+    Stores a file under the SHA-256 of its content, so identical uploads
+    share one stored file. The content is hashed chunk by chunk, and is
+    not written again when a file with that hash already exists.
+
+    Saving takes a reference on the file's ImageBlob. The blob row stays
+    locked until the transaction ends, so gc_image_blobs cannot delete a
+    file that an upload decided to reuse.
+    """
+
+    def save(self, name, content, save=True):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        ext = os.path.splitext(name)[1].lower()
+        name = self.field.generate_filename(
+            self.instance, f'{digest.hexdigest()}{ext}',
+        )
+        with transaction.atomic():
+            # Only check for the file under the lock: the collector may
+            # have deleted it, and the blob, while we waited.
+            ImageBlob.objects.acquire(name)
+            if not self.storage.exists(name):
+                name = self.storage.save(
+                    name, content, max_length=self.field.max_length,
+                )
+        self.name = name
+        setattr(self.instance, self.field.attname, self.name)
+        self._committed = True
+        if save:
+            self.instance.save()
 
-    return os.path.join('uploads', 'recipe', filename)
+    save.alters_data = True
+
+
+class ContentAddressedImageField(models.ImageField):
+    """ ImageField whose files are named by their content hash """
+    attr_class = ContentAddressedFieldFile
 
 
 class Usermanager(BaseUserManager):
@@ -51,6 +107,38 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def mark_changed(self):
+        """
+        Record that the recipes in the queryset changed, in one UPDATE.
+
+        Bumps updated_at and recomputes the stored search vector. Titles
+        rank above descriptions, which rank above tag and ingredient names.
+        Used when a recipe's representation changes without the row
+        being saved, e.g. when its tags change or a tag is renamed.
+        """
+        return self.update(updated_at=timezone.now(), search_vector=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(
+                _related_names(Tag), weight='C', config=SEARCH_CONFIG,
+            )
+            + SearchVector(
+                _related_names(Ingredient), weight='C', config=SEARCH_CONFIG,
+            )
+        ))
+
+
+def _related_names(model):
+    """ Space separated names of the tags or ingredients of a recipe """
+    names = model.objects.filter(
+        recipe=models.OuterRef('pk'),
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('name', ' '),
+    ).values('names')
+    return Coalesce(models.Subquery(names), models.Value(''))
+
+
 class Recipe(models.Model):
     """Recipe Model."""
     user = models.ForeignKey(
@@ -63,7 +151,32 @@ class Recipe(models.Model):
     link = models.CharField(max_length=255, blank=True)
     tags = models.ManyToManyField('Tag')
     ingredients = models.ManyToManyField('Ingredient')
-    image = models.ImageField(null=True, upload_to = recipe_image_file_path)
+    image = ContentAddressedImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+    )
+    image_variants = models.JSONField(default=dict, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='recipe_user_id_desc_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx',
+            ),
+            models.Index(
+                fields=['image'],
+                condition=~Q(image=''),
+                name='recipe_image_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -76,6 +189,27 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                'user',
+                name_prefix_key(),
+                name='tag_name_prefix_idx',
+            ),
+            GinIndex(
+                fields=['name'],
+                opclasses=['gin_trgm_ops'],
+                name='tag_name_trgm_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -88,6 +222,100 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                'user',
+                name_prefix_key(),
+                name='ingredient_name_prefix_idx',
+            ),
+            GinIndex(
+                fields=['name'],
+                opclasses=['gin_trgm_ops'],
+                name='ingredient_name_trgm_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Number of records of an import source already committed, and the
+    byte offset of the first record after them
+    """
+    source = models.CharField(max_length=255, unique=True)
+    position = models.PositiveBigIntegerField(default=0)
+    offset = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source} @ {self.position}'
+
+
+class ImageBlobManager(models.Manager):
+
+    def acquire(self, name):
+        """
+        Add a reference to a stored file, locking its blob row until the
+        transaction ends. Creates the row if it does not exist (any more).
+        """
+        if not name:
+            return
+        with transaction.atomic():
+            blob, created = self.select_for_update().get_or_create(
+                name=name, defaults={'refcount': 1},
+            )
+            if created:
+                return
+            updated = self.filter(pk=blob.pk).update(
+                refcount=F('refcount') + 1,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                raise self.model.DoesNotExist(
+                    f'Image blob {name!r} disappeared while locked.'
+                )
+
+    def release(self, name):
+        """ Drop a reference to a stored file """
+        if not name:
+            return
+        self.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1,
+            updated_at=timezone.now(),
+        )
+
+
+class ImageBlob(models.Model):
+    """
+    Reference count of a content addressed image file. Files whose count
+    dropped to zero are deleted by the gc_image_blobs command after a
+    grace period.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['updated_at'],
+                condition=Q(refcount=0),
+                name='imageblob_unreferenced_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
@@ -0,0 +1,65 @@
+# Parsers for the API
+
+import codecs
+from io import BytesIO
+
+import cbor2
+import msgpack
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from core.renderers import (
+    CBORRenderer,
+    FastJSONRenderer,
+    MessagePackRenderer,
+)
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSON parser that decodes UTF-8 bodies with orjson. Invalid bodies
+    and other charsets go through the stdlib parser, so error messages
+    stay those of JSONParser. Integers beyond 64 bits, which no field of
+    the API accepts, are read as floats.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = (
+            parser_context.get('encoding') or settings.DEFAULT_CHARSET
+        )
+        if codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(BytesIO(body), media_type, parser_context)
+
+
+class MessagePackParser(BaseParser):
+    """ Parser for MessagePack request bodies """
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class CBORParser(BaseParser):
+    """ Parser for CBOR request bodies """
+    media_type = 'application/cbor'
+    renderer_class = CBORRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (cbor2.CBORDecodeError, ValueError, TypeError) as exc:
+            raise ParseError(f'CBOR parse error - {exc}')
@@ -0,0 +1,88 @@
+# Renderers for the API
+
+from decimal import Decimal
+
+import cbor2
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that encodes with orjson.
+
+    The output matches JSONRenderer's compact UTF-8 output: datetimes end
+    in Z when in UTC, U+2028 and U+2029 are escaped and anything orjson
+    has no native encoding for (Decimal, lazy strings, querysets, ...)
+    goes through DRF's JSONEncoder. Floats may use a shorter exponent
+    form. Indented or ASCII-only output falls back to the stdlib encoder.
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=self.options,
+        )
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028')
+            ret = ret.replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def binary_default(obj):
+    """
+    Return a value the binary encoders can store for obj. Decimals
+    become strings, exactly like the price fields the serializers
+    return, everything else is encoded as for JSON (datetimes as ISO
+    8601 strings, lazy strings as strings, ...).
+    """
+    if isinstance(obj, Decimal):
+        return str(obj)
+    return JSONEncoder().default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer for MessagePack, with the same values as the JSON output:
+    decimal fields are strings and image fields are URL strings.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=binary_default, use_bin_type=True)
+
+
+class CBORRenderer(BaseRenderer):
+    """
+    Renderer for CBOR (RFC 8949), with the same values as the JSON
+    output: decimal fields are strings and image fields are URL strings.
+    Datetimes and decimals that reach the renderer unserialized use the
+    standard date/time string (0) and decimal fraction (4) tags.
+    """
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(
+            data,
+            default=lambda encoder, obj: encoder.encode(binary_default(obj)),
+        )
@@ -0,0 +1,111 @@
+# Signal handlers for the core models
+
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core.models import (
+    ImageBlob,
+    Recipe,
+    Tag,
+    Ingredient,
+)
+
+_recipe_batch = threading.local()
+
+
+def mark_recipes_changed(recipe_ids):
+    """ Mark recipes as changed now, or at the end of a batch """
+    pending = getattr(_recipe_batch, 'recipe_ids', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).mark_changed()
+
+
+@contextmanager
+def batch_recipe_changes():
+    """
+    Collect the recipe changes signalled inside the block and mark them
+    with one UPDATE when it exits, so saving a recipe and then setting
+    its tags and ingredients does not recompute it three times.
+    """
+    if getattr(_recipe_batch, 'recipe_ids', None) is not None:
+        yield
+        return
+    _recipe_batch.recipe_ids = set()
+    try:
+        yield
+    except BaseException:
+        _recipe_batch.recipe_ids = None
+        raise
+    recipe_ids, _recipe_batch.recipe_ids = _recipe_batch.recipe_ids, None
+    mark_recipes_changed(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def mark_changed_on_recipe_save(sender, instance, **kwargs):
+    """ Refresh the derived fields of a saved recipe """
+    mark_recipes_changed([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def mark_changed_on_relation_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """ Refresh recipes whose tags or ingredients were changed """
+    if action == 'pre_clear' and reverse:
+        instance._changed_recipe_ids = list(
+            instance.recipe_set.values_list('pk', flat=True)
+        )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif action == 'post_clear':
+        recipe_ids = instance.__dict__.pop('_changed_recipe_ids', [])
+    else:
+        recipe_ids = pk_set
+    mark_recipes_changed(recipe_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def mark_changed_on_rename(sender, instance, created, **kwargs):
+    """ Refresh recipes using a renamed tag or ingredient """
+    if not created:
+        mark_recipes_changed(
+            list(instance.recipe_set.values_list('pk', flat=True))
+        )
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_recipes_on_delete(sender, instance, **kwargs):
+    """ Remember the recipes of a tag or ingredient about to be deleted """
+    instance._changed_recipe_ids = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def mark_changed_on_delete(sender, instance, **kwargs):
+    """ Refresh recipes that used a deleted tag or ingredient """
+    mark_recipes_changed(instance.__dict__.pop('_changed_recipe_ids', []))
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_on_delete(sender, instance, **kwargs):
+    """ Drop the reference a deleted recipe held on its image file """
+    ImageBlob.objects.release(instance.image.name)
@@ -0,0 +1,137 @@
+"""Tests for the MessagePack and CBOR renderers and parsers """
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+
+import cbor2
+import msgpack
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.parsers import CBORParser, MessagePackParser
+from core.renderers import CBORRenderer, MessagePackRenderer
+
+FORMATS = [
+    ('application/msgpack', msgpack.packb, msgpack.unpackb),
+    ('application/cbor', cbor2.dumps, cbor2.loads),
+]
+
+
+class BinaryRendererTests(SimpleTestCase):
+    """Test the binary renderers and parsers."""
+
+    def test_round_trip(self):
+        """Test rendered data parses back to the same values."""
+        data = {'id': 1, 'title': 'Crème', 'tags': [{'id': 2}], 'x': None}
+        for renderer, parser in (
+            (MessagePackRenderer(), MessagePackParser()),
+            (CBORRenderer(), CBORParser()),
+        ):
+            body = renderer.render(data)
+            self.assertEqual(parser.parse(BytesIO(body)), data)
+
+    def test_decimal_is_a_string(self):
+        """Test decimals are encoded like the price field."""
+        data = {'price': Decimal('5.50')}
+
+        self.assertEqual(
+            msgpack.unpackb(MessagePackRenderer().render(data)),
+            {'price': '5.50'},
+        )
+
+    def test_datetime_encoding(self):
+        """Test datetimes are ISO strings in MessagePack, tagged in CBOR."""
+        moment = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        data = {'at': moment}
+
+        packed = msgpack.unpackb(MessagePackRenderer().render(data))
+        self.assertEqual(packed, {'at': '2024-01-02T03:04:05Z'})
+        self.assertEqual(cbor2.loads(CBORRenderer().render(data)), data)
+
+    def test_invalid_body(self):
+        """Test malformed bodies raise a parse error."""
+        for parser in (MessagePackParser(), CBORParser()):
+            with self.assertRaises(ParseError):
+                parser.parse(BytesIO(b'\xc1'))
+
+
+class BinaryNegotiationTests(TestCase):
+    """Test clients can talk to the API in binary formats."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='password123',
+            name='Test',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_list(self):
+        """Test the recipe list answers with the requested format."""
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Curry',
+            time_minutes=10,
+            price=Decimal('5.50'),
+        )
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Hot'))
+        expected = self.client.get(reverse('recipe:recipe-list')).json()
+
+        for media_type, _, loads in FORMATS:
+            res = self.client.get(
+                reverse('recipe:recipe-list'),
+                HTTP_ACCEPT=media_type,
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res['Content-Type'], media_type)
+            self.assertIn('Accept', res['Vary'])
+            self.assertEqual(loads(res.content), expected)
+            self.assertEqual(expected[0]['price'], '5.50')
+
+    def test_create_recipe(self):
+        """Test recipes can be created from binary bodies."""
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 20,
+            'price': '4.25',
+            'tags': [{'name': 'Warm'}],
+        }
+        for media_type, dumps, loads in FORMATS:
+            res = self.client.post(
+                reverse('recipe:recipe-list'),
+                dumps(payload),
+                content_type=media_type,
+                HTTP_ACCEPT=media_type,
+            )
+
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(loads(res.content)['price'], '4.25')
+        self.assertEqual(Recipe.objects.filter(title='Soup').count(), 2)
+
+    def test_user_endpoints(self):
+        """Test the user views negotiate binary formats too."""
+        client = APIClient()
+        for media_type, dumps, loads in FORMATS:
+            res = client.post(
+                reverse('user:token'),
+                dumps({
+                    'email': 'user@example.com',
+                    'password': 'password123',
+                }),
+                content_type=media_type,
+                HTTP_ACCEPT=media_type,
+            )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertIn('token', loads(res.content))
+
+            res = self.client.get(reverse('user:me'), HTTP_ACCEPT=media_type)
+            self.assertEqual(loads(res.content)['email'], 'user@example.com')
@@ -0,0 +1,179 @@
+"""Tests for the database backend's health checks and pool"""
+
+import threading
+
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.backends.postgresql.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """A connection that only tracks being reset and closed."""
+
+    def __init__(self):
+        self.closed = 0
+        self.resets = 0
+
+    def close(self):
+        self.closed = 1
+
+
+def reset(conn):
+    if conn.closed:
+        raise RuntimeError('closed')
+    conn.resets += 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the connection pool."""
+
+    def test_reuses_connections(self):
+        """Test a released connection is reset and handed out again."""
+        pool = ConnectionPool(max_size=2, reset=reset)
+
+        conn, created = pool.acquire(FakeConnection)
+        pool.release(conn)
+        again, reused_created = pool.acquire(FakeConnection)
+
+        self.assertTrue(created)
+        self.assertFalse(reused_created)
+        self.assertIs(again, conn)
+        self.assertEqual(conn.resets, 1)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['acquired'], 2)
+
+    def test_overflow_closed_on_release(self):
+        """Test connections over max_size are closed when released."""
+        pool = ConnectionPool(max_size=1, max_overflow=1)
+        first, _ = pool.acquire(FakeConnection)
+        second, _ = pool.acquire(FakeConnection)
+
+        pool.release(second)
+        pool.release(first)
+
+        self.assertTrue(second.closed)
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_timeout(self):
+        """Test acquiring from an exhausted pool times out."""
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        pool.acquire(FakeConnection)
+
+        with self.assertRaises(PoolTimeout), self.assertLogs(
+            'core.backends.postgresql.pool', 'WARNING',
+        ):
+            pool.acquire(FakeConnection)
+
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_wait_recorded(self):
+        """Test waiting for a released connection is measured."""
+        pool = ConnectionPool(max_size=1, timeout=5)
+        conn, _ = pool.acquire(FakeConnection)
+        timer = threading.Timer(0.05, pool.release, [conn])
+        timer.start()
+
+        again, _ = pool.acquire(FakeConnection)
+        timer.join()
+
+        stats = pool.stats()
+        self.assertIs(again, conn)
+        self.assertEqual(stats['waited'], 1)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.04)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_broken_connections_discarded(self):
+        """Test connections failing the check or reset are replaced."""
+        pool = ConnectionPool(
+            max_size=1,
+            check=lambda conn: not conn.closed,
+            reset=reset,
+        )
+        conn, _ = pool.acquire(FakeConnection)
+        pool.release(conn)
+        conn.closed = 1
+
+        again, created = pool.acquire(FakeConnection)
+        again.close()
+        pool.release(again)
+
+        self.assertTrue(created)
+        self.assertIsNot(again, conn)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertEqual(pool.stats()['closed'], 2)
+
+    def test_connect_failure_frees_room(self):
+        """Test a failed connect does not use up the pool."""
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+
+        def fail():
+            raise RuntimeError('down')
+
+        with self.assertRaises(RuntimeError):
+            pool.acquire(fail)
+        conn, created = pool.acquire(FakeConnection)
+
+        self.assertTrue(created)
+
+
+class DatabaseWrapperTests(TransactionTestCase):
+    """Test health checks and pooling in the database backend."""
+
+    def _connection(self, **settings):
+        conn = connection.copy()
+        conn.settings_dict.update(settings)
+        self.addCleanup(conn.close)
+        return conn
+
+    def _query(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()[0]
+
+    def test_health_check_reconnects(self):
+        """Test a dropped persistent connection is replaced."""
+        conn = self._connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        self._query(conn)
+        conn.connection.close()
+
+        conn.close_if_unusable_or_obsolete()
+
+        self.assertEqual(self._query(conn), 1)
+
+    def test_health_check_once_per_request(self):
+        """Test the check runs once until the next request."""
+        conn = self._connection(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        self._query(conn)
+        conn.close_if_unusable_or_obsolete()
+
+        with CaptureQueriesContext(conn) as queries:
+            self._query(conn)
+            self._query(conn)
+
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(conn.health_check_done)
+
+    def test_pool_reuses_connection(self):
+        """Test closing a pooled connection keeps it for the next connect."""
+        conn = self._connection(
+            CONN_MAX_AGE=0,
+            POOL={'MAX_SIZE': 1, 'TIMEOUT': 1},
+        )
+        pool = conn.pool
+        self._query(conn)
+        raw = conn.connection
+
+        conn.close()
+        self.assertEqual(self._query(conn), 1)
+
+        self.assertIs(conn.connection, raw)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['acquired'], 2)
+
+        conn.close()
+        pool.close_all()
+        self.assertEqual(pool.stats()['size'], 0)
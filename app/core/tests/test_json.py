@@ -0,0 +1,108 @@
+"""Tests for the JSON renderer and parser """
+
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+PAYLOAD = [
+    OrderedDict([
+        ('id', 1),
+        ('title', 'Crème brûlée     "quoted"'),
+        ('price', '5.50'),
+        ('tags', [{'id': 2, 'name': 'Dessert'}]),
+        ('image_variants', {}),
+        ('link', None),
+    ]),
+    {
+        'amount': Decimal('12.25'),
+        'created': datetime(2024, 1, 2, 3, 4, 5, 678000, timezone.utc),
+        'day': date(2024, 1, 2),
+        'uid': uuid.UUID(int=1),
+        'lazy': gettext_lazy('Recipe'),
+        10: 'integer key',
+        'flag': True,
+    },
+]
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Test the orjson renderer matches the stdlib renderer."""
+
+    def test_output_matches_json_renderer(self):
+        """Test the bytes are the same as JSONRenderer's."""
+        self.assertEqual(
+            FastJSONRenderer().render(PAYLOAD),
+            JSONRenderer().render(PAYLOAD),
+        )
+
+    def test_indent_falls_back(self):
+        """Test indented output is left to the stdlib encoder."""
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(PAYLOAD, media_type),
+            JSONRenderer().render(PAYLOAD, media_type),
+        )
+
+    def test_none_renders_empty(self):
+        """Test no data renders an empty body."""
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """Test the orjson parser matches the stdlib parser."""
+
+    def _parse(self, parser, body, encoding='utf-8'):
+        return parser.parse(BytesIO(body), parser_context={
+            'encoding': encoding,
+        })
+
+    def test_parse(self):
+        """Test a body parses to the same data."""
+        body = '{"title": "Crème", "price": 5.5, "tags": [1, 2]}'.encode()
+
+        self.assertEqual(
+            self._parse(FastJSONParser(), body),
+            self._parse(JSONParser(), body),
+        )
+
+    def test_64_bit_integer(self):
+        """Test 64 bit integers are read exactly."""
+        body = b'{"id": 9223372036854775807}'
+
+        data = self._parse(FastJSONParser(), body)
+
+        self.assertEqual(data['id'], 9223372036854775807)
+
+    def test_other_charset(self):
+        """Test bodies in other charsets are decoded."""
+        body = '{"title": "Crème"}'.encode('latin-1')
+
+        data = self._parse(FastJSONParser(), body, encoding='latin-1')
+
+        self.assertEqual(data, {'title': 'Crème'})
+
+    def test_invalid_json(self):
+        """Test invalid bodies raise the same error."""
+        with self.assertRaises(ParseError) as expected:
+            self._parse(JSONParser(), b'{"title": }')
+        with self.assertRaises(ParseError) as actual:
+            self._parse(FastJSONParser(), b'{"title": }')
+
+        self.assertEqual(str(actual.exception), str(expected.exception))
+
+    def test_nan_rejected(self):
+        """Test non-standard constants stay rejected."""
+        with self.assertRaises(ParseError):
+            self._parse(FastJSONParser(), b'{"price": NaN}')
@@ -0,0 +1,227 @@
+"""Tests for the API middleware """
+
+import gzip
+import json
+from unittest.mock import patch
+
+import brotli
+import zstandard
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.middleware import (
+    CompressionMiddleware,
+    GzipCodec,
+    parse_accept_encoding,
+)
+from core.models import Recipe
+
+BODY = json.dumps([{'title': f'Recipe {i}'} for i in range(200)]).encode()
+
+
+def compress(response, accept_encoding):
+    """Return the response after the middleware, for an Accept-Encoding"""
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    middleware = CompressionMiddleware(lambda request: response)
+    return middleware(request)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test compressing responses."""
+
+    def _response(self, body=BODY, content_type='application/json'):
+        return HttpResponse(body, content_type=content_type)
+
+    def test_parse_accept_encoding(self):
+        """Test q-values are read from Accept-Encoding."""
+        self.assertEqual(
+            parse_accept_encoding('gzip, br;q=0.5, zstd;q=0'),
+            {'gzip': 1.0, 'br': 0.5, 'zstd': 0.0},
+        )
+
+    def test_encodings(self):
+        """Test each encoding round trips."""
+        for encoding, decompress in (
+            ('gzip', gzip.decompress),
+            ('br', brotli.decompress),
+            ('zstd', zstandard.ZstdDecompressor().decompress),
+        ):
+            res = compress(self._response(), encoding)
+
+            self.assertEqual(res['Content-Encoding'], encoding)
+            self.assertEqual(decompress(res.content), BODY)
+            self.assertEqual(res['Content-Length'], str(len(res.content)))
+            self.assertIn('Accept-Encoding', res['Vary'])
+
+    def test_preference(self):
+        """Test q-values pick the encoding, then server preference."""
+        res = compress(self._response(), 'gzip, br;q=0.5')
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+
+        res = compress(self._response(), 'gzip, deflate, br, zstd')
+        self.assertEqual(res['Content-Encoding'], 'br')
+
+    def test_not_accepted(self):
+        """Test identity is sent when nothing usable is accepted."""
+        res = compress(self._response(), 'deflate, gzip;q=0')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(res.content, BODY)
+
+    def test_small_body(self):
+        """Test bodies under the threshold are left alone."""
+        res = compress(self._response(b'{"id": 1}'), 'gzip')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    @override_settings(COMPRESSION_CONTENT_TYPES=['application/json'])
+    def test_content_type_not_allowed(self):
+        """Test content types outside the allowlist are left alone."""
+        res = compress(self._response(content_type='image/png'), 'gzip')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    @override_settings(COMPRESSION_CONTENT_TYPES=['text/html'])
+    def test_csrf_token_not_compressed(self):
+        """Test pages carrying a CSRF token are left alone."""
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        get_token(request)
+        response = self._response(content_type='text/html')
+        middleware = CompressionMiddleware(lambda request: response)
+
+        res = middleware(request)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_html_not_compressed_by_default(self):
+        """Test HTML pages are not compressed with the default types."""
+        res = compress(self._response(content_type='text/html'), 'gzip')
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+
+    def test_etag_weakened(self):
+        """Test a strong ETag becomes weak once compressed."""
+        response = self._response()
+        response['ETag'] = '"abc"'
+
+        res = compress(response, 'gzip')
+
+        self.assertEqual(res['ETag'], 'W/"abc"')
+
+    def test_streaming(self):
+        """Test streamed bodies are compressed as they go."""
+        chunks = [BODY[i:i + 100] for i in range(0, len(BODY), 100)]
+        response = StreamingHttpResponse(
+            iter(chunks),
+            content_type='application/x-ndjson',
+        )
+
+        res = compress(response, 'gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(res.streaming_content)),
+            BODY,
+        )
+
+
+class PrecompressedResponseTests(TestCase):
+    """Test cached list responses keep their compressed bodies."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+        for i in range(30):
+            Recipe.objects.create(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=10,
+                price='5.00',
+            )
+
+    def test_cached_list_not_recompressed(self):
+        """Test a cache hit reuses the body compressed on the miss."""
+        url = reverse('recipe:recipe-list')
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        with patch.object(GzipCodec, 'compress') as compress_body:
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        compress_body.assert_not_called()
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(json.loads(gzip.decompress(second.content))), 30)
+
+
+@override_settings(
+    MIDDLEWARE=[
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.common.CommonMiddleware',
+        'core.middleware.PathScopedMiddleware',
+    ],
+    SCOPED_MIDDLEWARE=[
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ],
+    SCOPED_MIDDLEWARE_EXCLUDE=['/api/'],
+)
+class PathScopedMiddlewareTests(TestCase):
+    """Test the browser middleware is skipped for the API only."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            email='admin@example.com',
+            password='password123',
+        )
+
+    def test_api_skips_scoped_middleware(self):
+        """Test token requests to the API run without sessions."""
+        token = Token.objects.create(user=self.user)
+
+        res = Client().get(
+            reverse('user:me'),
+            HTTP_AUTHORIZATION=f'Token {token.key}',
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['email'], 'admin@example.com')
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+        self.assertEqual(len(res.cookies), 0)
+
+    def test_admin_keeps_scoped_middleware(self):
+        """Test the admin still gets sessions and logs in."""
+        client = Client()
+
+        res = client.post(reverse('admin:login'), {
+            'username': 'admin@example.com',
+            'password': 'password123',
+        })
+
+        self.assertEqual(res.status_code, 302)
+        self.assertIn('sessionid', res.cookies)
+        res = client.get(reverse('admin:index'))
+        self.assertEqual(res.status_code, 200)
+
+    def test_admin_enforces_csrf(self):
+        """Test the CSRF check still runs for the admin."""
+        client = Client(enforce_csrf_checks=True)
+
+        res = client.post(reverse('admin:login'), {
+            'username': 'admin@example.com',
+            'password': 'password123',
+        })
+
+        self.assertEqual(res.status_code, 403)
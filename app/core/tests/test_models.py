@@ -1,7 +1,9 @@
 """Tests for models """
 
-from unittest.mock import patch
+import hashlib
 from decimal import Decimal
+from django.core.files.base import ContentFile
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
@@ -77,6 +79,16 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_name_unique_per_user(self):
+        """ Test a user cannot have two tags with the same name """
+        user = create_user()
+        other_user = create_user(email='other@example.com')
+        models.Tag.objects.create(user=user, name='Tag1')
+        models.Tag.objects.create(user=other_user, name='Tag1')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='Tag1')
+
     def test_create_ingredient(self):
         """ Test Creating an ingredient model """
         user = create_user()
@@ -87,10 +99,29 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
-    @patch('core.models.uuid.uuid4')
-    def test_recipe_file_name_uuid(self, mock_uuid):
-        uuid = 'test-uuid'
-        mock_uuid.return_value = uuid
-        file_path = models.recipe_image_file_path(None, 'example.jpg')
+    def test_recipe_file_path_sharded(self):
+        """Test image paths are sharded by the first name characters."""
+        file_path = models.recipe_image_file_path(None, 'abcdef.jpg')
 
-        self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
\ No newline at end of file
+        self.assertEqual(file_path, 'uploads/recipe/ab/abcdef.jpg')
+
+    def test_recipe_image_named_by_content(self):
+        """Test identical images are stored once under their hash."""
+        user = create_user()
+        content = b'same image bytes'
+        recipes = []
+        for title in ['one', 'two']:
+            recipe = models.Recipe.objects.create(
+                user=user,
+                title=title,
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+            recipe.image.save('photo.JPG', ContentFile(content))
+            recipes.append(recipe)
+        self.addCleanup(recipes[0].image.delete, save=False)
+
+        digest = hashlib.sha256(content).hexdigest()
+        expected = f'uploads/recipe/{digest[:2]}/{digest}.jpg'
+        self.assertEqual(recipes[0].image.name, expected)
+        self.assertEqual(recipes[1].image.name, expected)
\ No newline at end of file
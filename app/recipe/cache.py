@@ -0,0 +1,134 @@
+# Response cache for the recipe list endpoints
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class ResponseCache:
+    """
+    Cache of list response data per user, invalidated by generation.
+
+    Every user has a generation number that is part of each of their
+    cache keys. Writes bump it, which orphans all of that user's entries
+    at once; orphans simply expire. The generation is bumped both when a
+    write happens and again when its transaction commits, so a read that
+    raced the write cannot leave data from before the commit behind under
+    the new generation.
+
+    Entries live in the cache named by RESPONSE_CACHE_ALIAS. The default
+    local-memory cache is per process, so deployments running several
+    workers should point the alias at a shared backend.
+    """
+
+    def __init__(self):
+        self.alias = getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')
+        self.timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generation_key(self, user_id):
+        return f'response-gen:{user_id}'
+
+    def generation(self, user_id):
+        """ Return the current generation of a user's entries """
+        key = self._generation_key(user_id)
+        generation = self.cache.get(key)
+        if generation is None:
+            # Start from the clock so an evicted counter never goes back
+            # to a generation that still has entries.
+            self.cache.add(key, time.time_ns(), None)
+            generation = self.cache.get(key)
+        return generation
+
+    def bump(self, user_id):
+        """ Invalidate every cached response of a user """
+        key = self._generation_key(user_id)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, time.time_ns(), None)
+
+    def invalidate(self, user_id):
+        """ Bump a user's generation now and after the current commit """
+        self.bump(user_id)
+        transaction.on_commit(lambda: self.bump(user_id))
+
+    def make_key(self, request):
+        """ Return the cache key for a list request """
+        parts = [
+            request.build_absolute_uri(request.path),
+            sorted(request.query_params.lists()),
+            getattr(request, 'accepted_media_type', ''),
+        ]
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        user_id = request.user.pk
+        return f'response:{user_id}:{self.generation(user_id)}:{digest}'
+
+    def get(self, key):
+        """ Return the cached entry for a key, or None """
+        if self.timeout <= 0:
+            return None
+        return self.cache.get(key)
+
+    def set(self, key, entry):
+        """ Cache an entry """
+        if self.timeout > 0:
+            self.cache.set(key, entry, self.timeout)
+
+    def get_body(self, key, encoding):
+        """ Return the compressed body stored with an entry, or None """
+        return self.get(f'{key}:{encoding}')
+
+    def set_body(self, key, encoding, body):
+        """
+        Store an entry's rendered body compressed with an encoding, so
+        later hits need not compress it again. The key includes the
+        accepted media type, so every hit renders the same body.
+        """
+        self.set(f'{key}:{encoding}', body)
+
+
+response_cache = ResponseCache()
+
+
+class FragmentCache:
+    """
+    Cache of serialized objects, keyed by serializer, id and version.
+
+    Keys include the serializer class and its field names, so changing a
+    serializer's output never serves fragments rendered by the old one.
+    """
+
+    def __init__(self):
+        self.alias = getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')
+        self.timeout = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, serializer, pk, version):
+        """ Return the key of an object's representation """
+        shape = [type(serializer).__name__, list(serializer.fields)]
+        digest = hashlib.md5(repr(shape).encode()).hexdigest()
+        return f'fragment:{digest}:{pk}:{version}'
+
+    def get_many(self, keys):
+        """ Return a dict of the cached fragments among keys """
+        if self.timeout <= 0 or not keys:
+            return {}
+        return self.cache.get_many(keys)
+
+    def set_many(self, fragments):
+        """ Cache a dict of key to fragment """
+        if self.timeout > 0 and fragments:
+            self.cache.set_many(fragments, self.timeout)
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,20 @@
+# System checks for the recipe app
+
+from django.core.checks import Warning, register
+
+from recipe.images import unwritable_formats
+
+
+@register()
+def check_variant_formats(app_configs, **kwargs):
+    """ Warn about configured image variant formats that cannot be made """
+    return [
+        Warning(
+            f'IMAGE_VARIANT_FORMATS includes {fmt!r}, which this Pillow '
+            f'build cannot write, so no {fmt} variants are generated.',
+            hint='Install the codec library (e.g. libwebp) and reinstall '
+                 'Pillow, or remove the format.',
+            id='recipe.W001',
+        )
+        for fmt in unwritable_formats()
+    ]
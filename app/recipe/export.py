@@ -0,0 +1,78 @@
+# Streaming export of recipes
+
+import csv
+import json
+from itertools import islice
+
+from core.models import Recipe
+
+EXPORT_FIELDS = ['title', 'description', 'time_minutes', 'price', 'link']
+CSV_LIST_SEPARATOR = '|'
+
+
+class Echo:
+    """ File-like object whose write() returns what it was given """
+
+    def write(self, value):
+        return value
+
+
+def _related_names(field_name, recipe_ids):
+    """ Return {recipe id: [names]} for one relation of some recipes """
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_column_name()
+    target = field.m2m_reverse_field_name()
+    names = {recipe_id: [] for recipe_id in recipe_ids}
+    rows = through.objects.filter(
+        **{f'{source}__in': recipe_ids}
+    ).order_by(f'{target}__name').values_list(source, f'{target}__name')
+    for recipe_id, name in rows:
+        names[recipe_id].append(name)
+    return names
+
+
+def iter_recipes(queryset, chunk_size):
+    """
+    Yield recipes as dicts with their tag and ingredient names.
+
+    Rows are read through a server-side cursor and the names are fetched
+    with one query per relation for every chunk_size recipes, so memory
+    use does not depend on how many recipes are exported.
+    """
+    rows = queryset.values('id', *EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size,
+    )
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        ids = [row['id'] for row in chunk]
+        tags = _related_names('tags', ids)
+        ingredients = _related_names('ingredients', ids)
+        for row in chunk:
+            row['price'] = str(row['price'])
+            row['tags'] = tags[row['id']]
+            row['ingredients'] = ingredients[row['id']]
+            yield row
+
+
+def ndjson_lines(recipes):
+    """ Yield one JSON document per line """
+    for recipe in recipes:
+        yield json.dumps(recipe) + '\n'
+
+
+def csv_lines(recipes):
+    """ Yield CSV lines, joining names with CSV_LIST_SEPARATOR """
+    writer = csv.writer(Echo())
+    yield writer.writerow(['id', *EXPORT_FIELDS, 'tags', 'ingredients'])
+    for recipe in recipes:
+        yield writer.writerow(
+            [recipe['id']]
+            + [recipe[field] for field in EXPORT_FIELDS]
+            + [
+                CSV_LIST_SEPARATOR.join(recipe['tags']),
+                CSV_LIST_SEPARATOR.join(recipe['ingredients']),
+            ]
+        )
@@ -0,0 +1,217 @@
+# Resized variants of recipe images
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import ImageBlob, Recipe
+from recipe.cache import response_cache
+
+VARIANT_DIR = 'variants'
+SAVE_OPTIONS = {
+    'jpeg': {'format': 'JPEG', 'quality': 80, 'optimize': True,
+             'progressive': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_sizes():
+    """ Return the configured variant widths, smallest first """
+    return sorted(getattr(settings, 'IMAGE_VARIANT_SIZES', [128, 512, 1024]))
+
+
+def _configured_formats():
+    return getattr(settings, 'IMAGE_VARIANT_FORMATS', ['webp', 'jpeg'])
+
+
+def _can_write(fmt):
+    Image.init()
+    return fmt in SAVE_OPTIONS and SAVE_OPTIONS[fmt]['format'] in Image.SAVE
+
+
+def variant_formats():
+    """ Return the configured formats that this Pillow build can write """
+    return [fmt for fmt in _configured_formats() if _can_write(fmt)]
+
+
+def unwritable_formats():
+    """
+    Return the configured formats that are unknown or that this Pillow
+    build cannot write, reported by the recipe.W001 system check
+    """
+    return [fmt for fmt in _configured_formats() if not _can_write(fmt)]
+
+
+def variant_name(name, size, fmt):
+    """ Return the storage name of one variant of an image """
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANT_DIR, f'{stem}-{size}.{fmt}')
+
+
+def _encode(image, fmt):
+    """ Return the bytes of an image saved in a variant format """
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def generate_variants(recipe_id, name):
+    """
+    Write the resized variants of a recipe image and record them.
+
+    Sizes are produced largest first, each resized from the previous
+    one, and sizes not smaller than the original are skipped. Nothing is
+    recorded if the recipe's image was replaced in the meantime.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    with storage.open(name) as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+
+    variants = {}
+    formats = variant_formats()
+    for size in reversed(variant_sizes()):
+        if size >= max(image.size):
+            continue
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        variants[str(size)] = {}
+        for fmt in formats:
+            target = variant_name(name, size, fmt)
+            # Stored images are never modified, so an existing variant
+            # (of the same file used by another recipe) is still valid.
+            if not storage.exists(target):
+                target = storage.save(
+                    target, ContentFile(_encode(image, fmt)),
+                )
+            variants[str(size)][fmt] = target
+
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants=variants,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        user_id = Recipe.objects.values_list(
+            'user_id', flat=True,
+        ).get(pk=recipe_id)
+        response_cache.invalidate(user_id)
+    return variants
+
+
+def delete_variants(name):
+    """ Delete every variant an image may have """
+    storage = Recipe._meta.get_field('image').storage
+    for size in variant_sizes():
+        for fmt in SAVE_OPTIONS:
+            storage.delete(variant_name(name, size, fmt))
+
+
+def delete_image_files(name):
+    """ Delete a stored image and every variant it may have """
+    Recipe._meta.get_field('image').storage.delete(name)
+    delete_variants(name)
+
+
+def release_variants(name):
+    """
+    Delete the variants of an image once the current transaction commits,
+    if no recipe refers to the image any more. The image itself is kept
+    for gc_image_blobs' grace period, so an upload of the same content
+    can still reuse it and will generate its variants again.
+    """
+    if not name:
+        return
+
+    def delete():
+        with transaction.atomic():
+            # Hold the blob's lock so an upload cannot take a reference
+            # while the variants are being deleted.
+            unused = ImageBlob.objects.select_for_update().filter(
+                name=name, refcount=0,
+            ).exists()
+            if unused:
+                delete_variants(name)
+
+    transaction.on_commit(delete)
+
+
+def _run(recipe_id, name):
+    """ Generate variants in a worker thread """
+    try:
+        generate_variants(recipe_id, name)
+    except Exception:
+        logger.exception('Could not generate variants of %s', name)
+    finally:
+        connection.close()
+
+
+def _get_executor():
+    """ Return the shared worker pool, creating it on first use """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2),
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def schedule_variants(recipe):
+    """
+    Generate the variants of a recipe's image once the upload commits,
+    in the worker pool, or inline when IMAGE_VARIANT_WORKERS is 0.
+    """
+    recipe_id, name = recipe.pk, recipe.image.name
+    if not name:
+        return
+    if getattr(settings, 'IMAGE_VARIANT_WORKERS', 2) <= 0:
+        transaction.on_commit(lambda: generate_variants(recipe_id, name))
+    else:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run, recipe_id, name)
+        )
+
+
+def variant_urls(recipe, image_size=None, request=None):
+    """
+    Return {size: {format: url}} for a recipe's image variants. With an
+    image_size, only the smallest variant at least that wide is returned,
+    or the largest one if none is. With a request the URLs are absolute,
+    like those of the image field.
+    """
+    variants = recipe.image_variants or {}
+    if image_size is not None and variants:
+        sizes = sorted(variants, key=int)
+        chosen = next(
+            (size for size in sizes if int(size) >= image_size),
+            sizes[-1],
+        )
+        variants = {chosen: variants[chosen]}
+    storage = Recipe._meta.get_field('image').storage
+
+    def url(name):
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    return {
+        size: {fmt: url(name) for fmt, name in formats.items()}
+        for size, formats in variants.items()
+    }
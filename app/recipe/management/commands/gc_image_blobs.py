@@ -0,0 +1,86 @@
+# Django command to delete image files nothing refers to any more
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import ImageBlob, Recipe
+from recipe.images import delete_image_files
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete content addressed image files, with their variants, whose '
+        'reference count has been zero for longer than the grace period.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes',
+            type=int,
+            default=60,
+            help='Keep unreferenced files this long, so uploads racing '
+                 'with the collector can still reuse them.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the files that would be deleted.',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        unreferenced = ImageBlob.objects.filter(
+            refcount=0,
+            updated_at__lt=cutoff,
+        ).order_by('pk')
+
+        if options['dry_run']:
+            total = 0
+            names = unreferenced.values_list('name', flat=True)
+            for name in names.iterator():
+                self.stdout.write(name)
+                total += 1
+            self.stdout.write(f'{total} unreferenced files.')
+            return
+
+        total = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                blobs = list(
+                    unreferenced.filter(pk__gt=last_pk)
+                    .select_for_update(skip_locked=True)
+                    [:options['batch_size']]
+                )
+                if not blobs:
+                    break
+                last_pk = blobs[-1].pk
+                # Recipes can still point at a file whose count is off,
+                # e.g. after an image was set outside the API. Repair the
+                # count instead of deleting the file.
+                in_use = dict(
+                    Recipe.objects.filter(
+                        image__in=[blob.name for blob in blobs],
+                    ).values('image').annotate(
+                        total=Count('pk'),
+                    ).values_list('image', 'total')
+                )
+                for name, refcount in in_use.items():
+                    ImageBlob.objects.filter(name=name).update(
+                        refcount=refcount,
+                    )
+                unused = [blob for blob in blobs if blob.name not in in_use]
+                for blob in unused:
+                    delete_image_files(blob.name)
+                ImageBlob.objects.filter(
+                    pk__in=[blob.pk for blob in unused],
+                ).delete()
+                total += len(unused)
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {total} unreferenced files.'
+        ))
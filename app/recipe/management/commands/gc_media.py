@@ -0,0 +1,137 @@
+# Django command to find recipe image files nothing refers to
+
+import glob
+import os
+import shutil
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import ImageBlob, Recipe
+from recipe.images import VARIANT_DIR
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream the recipe upload directory and delete (or quarantine) '
+        'files that no recipe refers to. Files tracked by an image blob '
+        'are left to gc_image_blobs. Variants are kept while their '
+        'original exists, so those of an original removed in this run go '
+        'in the next one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join('uploads', 'recipe'),
+            help='Directory to scan, relative to the image storage.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age-minutes',
+            type=int,
+            default=60,
+            help='Skip newer files, which may belong to an upload that '
+                 'has not committed yet.',
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Move orphans under this directory instead of deleting.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the orphans.',
+        )
+
+    def handle(self, *args, **options):
+        self.storage = Recipe._meta.get_field('image').storage
+        self.location = self.storage.location
+        root = os.path.join(self.location, options['path'])
+        if not os.path.isdir(root):
+            raise CommandError(f'{root} is not a directory.')
+        self.quarantine = options['quarantine']
+        self.dry_run = options['dry_run']
+        cutoff = time.time() - options['min_age_minutes'] * 60
+
+        scanned = orphans = reclaimed = 0
+        files = self._scan(root, cutoff)
+        while True:
+            batch = list(islice(files, options['batch_size']))
+            if not batch:
+                break
+            scanned += len(batch)
+            for name, size in self._orphans(batch):
+                self._dispose(name)
+                orphans += 1
+                reclaimed += size
+
+        verb = 'Found' if self.dry_run else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} files. {verb} {orphans} orphans '
+            f'({reclaimed / 1024 / 1024:.1f} MiB).'
+        ))
+
+    def _scan(self, root, cutoff):
+        """
+        Yield (storage name, size) of files older than cutoff, walking
+        the tree with os.scandir so only one directory listing is held
+        at a time.
+        """
+        directories = [root]
+        while directories:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    name = os.path.relpath(entry.path, self.location)
+                    yield name.replace(os.sep, '/'), stat.st_size
+
+    def _orphans(self, batch):
+        """ Return the files of a batch that nothing refers to """
+        names = [name for name, _ in batch]
+        referenced = set(
+            Recipe.objects.filter(image__in=names)
+            .values_list('image', flat=True)
+        )
+        referenced.update(
+            ImageBlob.objects.filter(name__in=names)
+            .values_list('name', flat=True)
+        )
+        return [
+            (name, size) for name, size in batch
+            if name not in referenced and not self._has_original(name)
+        ]
+
+    def _has_original(self, name):
+        """ Return whether a variant's original image is still stored """
+        directory, filename = os.path.split(name)
+        if os.path.basename(directory) != VARIANT_DIR:
+            return False
+        stem = filename.rsplit('-', 1)[0]
+        original_dir = os.path.join(self.location, os.path.dirname(directory))
+        pattern = os.path.join(glob.escape(original_dir), glob.escape(stem))
+        return bool(glob.glob(f'{pattern}.*'))
+
+    def _dispose(self, name):
+        """ List, quarantine or delete one orphan """
+        self.stdout.write(name)
+        if self.dry_run:
+            return
+        source = self.storage.path(name)
+        if self.quarantine:
+            target = os.path.join(self.quarantine, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+        else:
+            os.remove(source)
@@ -0,0 +1,323 @@
+# Django command to bulk import recipes from a JSONL or CSV file
+
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import (
+    ImportCheckpoint,
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.cache import response_cache
+from recipe.export import CSV_LIST_SEPARATOR, EXPORT_FIELDS
+
+
+class LineReader:
+    """
+    Iterator of the decoded lines of a binary file that keeps the byte
+    offset of the next line, for the csv module to read from
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.offset = handle.tell()
+
+    def seek(self, offset):
+        self.handle.seek(offset)
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.handle.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream recipes from a JSONL or CSV file into the database in '
+        'committed chunks. Re-running the same import resumes after the '
+        'last committed chunk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file to import.')
+        parser.add_argument(
+            '--format',
+            choices=['jsonl', 'csv'],
+            help='Input format, guessed from the file extension if omitted.',
+        )
+        parser.add_argument(
+            '--user',
+            help='Email of the owner of records without a "user" field.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Records committed per transaction.',
+        )
+        parser.add_argument(
+            '--source',
+            help='Checkpoint name, defaults to the absolute file path.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint and import from the first record.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or self._guess_format(path)
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be positive.')
+        source = options['source'] or os.path.abspath(path)
+
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(source=source)
+        if options['restart']:
+            checkpoint.position = checkpoint.offset = 0
+            checkpoint.save()
+        if checkpoint.position:
+            self.stdout.write(
+                f'Resuming after {checkpoint.position} records.'
+            )
+
+        self.users = {}
+        self.names = {Tag: {}, Ingredient: {}}
+        self.default_user = options['user']
+        imported = skipped = 0
+        started = time.monotonic()
+
+        with open(path, 'rb') as handle:
+            records = self._read(handle, file_format, checkpoint)
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    created, errors = self._import_chunk(chunk)
+                    checkpoint.position += len(chunk)
+                    checkpoint.offset = chunk[-1][2]
+                    checkpoint.save(
+                        update_fields=['position', 'offset', 'updated_at'],
+                    )
+                for user_id in {recipe.user_id for recipe in created}:
+                    response_cache.invalidate(user_id)
+                for line, error in sorted(errors):
+                    self.stderr.write(f'Record {line}: {error}')
+                imported += len(created)
+                skipped += len(errors)
+                self.stdout.write(
+                    f'{checkpoint.position} records read, {imported} '
+                    f'imported ({self._rate(imported, started):.0f} rows/s)'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} recipes, skipped {skipped}, in '
+            f'{time.monotonic() - started:.1f}s '
+            f'({self._rate(imported, started):.0f} rows/s).'
+        ))
+
+    def _rate(self, count, started):
+        """ Return count per second since started """
+        elapsed = time.monotonic() - started
+        return count / elapsed if elapsed > 0 else 0
+
+    def _guess_format(self, path):
+        """ Return the input format for a file extension """
+        extension = os.path.splitext(path)[1].lower()
+        if extension in ('.jsonl', '.ndjson', '.json'):
+            return 'jsonl'
+        if extension == '.csv':
+            return 'csv'
+        raise CommandError('Cannot guess the format, pass --format.')
+
+    def _read(self, handle, file_format, checkpoint):
+        """
+        Yield (record number, record or error, offset after the record)
+        for the records after the checkpoint, one at a time.
+
+        Reading starts at the checkpoint's byte offset, so resuming does
+        not parse the committed records again. Checkpoints saved without
+        an offset skip their records by count instead.
+        """
+        skip = 0
+        if checkpoint.offset:
+            start = checkpoint.offset
+        else:
+            start, skip = 0, checkpoint.position
+        records = (
+            self._read_csv(handle, start) if file_format == 'csv'
+            else self._read_jsonl(handle, start)
+        )
+        for number, (record, offset) in enumerate(
+            islice(records, skip, None), checkpoint.position + 1,
+        ):
+            yield number, record, offset
+
+    def _read_csv(self, handle, start):
+        """ Yield (row, offset after it) from the CSV rows from start """
+        lines = LineReader(handle)
+        header = next(csv.reader(lines), None)
+        if header is None:
+            return
+        if start > lines.offset:
+            lines.seek(start)
+        for row in csv.DictReader(lines, fieldnames=header):
+            for field in ('tags', 'ingredients'):
+                row[field] = [
+                    name for name in
+                    (row.get(field) or '').split(CSV_LIST_SEPARATOR)
+                    if name.strip()
+                ]
+            yield row, lines.offset
+
+    def _read_jsonl(self, handle, start):
+        """ Yield (record or error, offset after it) from the lines """
+        handle.seek(start)
+        offset = start
+        for line in handle:
+            offset += len(line)
+            if not line.strip():
+                yield ValueError('empty line'), offset
+                continue
+            try:
+                yield json.loads(line), offset
+            except ValueError as error:
+                yield error, offset
+
+    def _import_chunk(self, chunk):
+        """
+        Insert the valid records of a chunk with one INSERT per table and
+        return the created recipes and the (record number, error) pairs
+        of the rejected ones.
+        """
+        errors = []
+        rows = []
+        for number, record, _ in chunk:
+            try:
+                row = self._clean(record)
+            except ValueError as error:
+                errors.append((number, str(error)))
+                continue
+            row['number'] = number
+            rows.append(row)
+        self._resolve_users(rows)
+
+        valid = []
+        for row in rows:
+            row['user_id'] = self.users.get(row.pop('user'))
+            if row['user_id'] is None:
+                errors.append((row.pop('number'), 'unknown user'))
+            else:
+                valid.append(row)
+        if not valid:
+            return [], errors
+
+        recipes = Recipe.objects.bulk_create([
+            Recipe(user_id=row['user_id'], **row['fields']) for row in valid
+        ])
+        self._link(recipes, valid, 'tags', Tag)
+        self._link(recipes, valid, 'ingredients', Ingredient)
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes]
+        ).mark_changed()
+        return recipes, errors
+
+    def _clean(self, record):
+        """ Validate one record and return the values to insert """
+        if isinstance(record, Exception):
+            raise ValueError(f'invalid record: {record}')
+        if not isinstance(record, dict):
+            raise ValueError('expected an object')
+        fields = {}
+        for name in EXPORT_FIELDS:
+            field = Recipe._meta.get_field(name)
+            value = record.get(name)
+            if value is None and field.blank:
+                value = ''
+            try:
+                fields[name] = field.clean(value, None)
+            except ValidationError as error:
+                raise ValueError(f'{name}: {" ".join(error.messages)}')
+        related = {}
+        for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+            max_length = model._meta.get_field('name').max_length
+            names = []
+            items = record.get(name) or []
+            if not isinstance(items, list):
+                raise ValueError(f'{name} must be a list')
+            for item in items:
+                if isinstance(item, dict):
+                    item = item.get('name')
+                if not isinstance(item, str) or not item.strip():
+                    raise ValueError(f'invalid {name} entry')
+                item = item.strip()
+                if len(item) > max_length:
+                    raise ValueError(f'{name} entry longer than {max_length}')
+                names.append(item)
+            related[name] = list(dict.fromkeys(names))
+        user = record.get('user') or self.default_user
+        if not user:
+            raise ValueError('no user, pass --user')
+        return {'user': user, 'fields': fields, **related}
+
+    def _resolve_users(self, rows):
+        """ Add the ids of users not seen yet to the email map """
+        emails = {row['user'] for row in rows} - self.users.keys()
+        if emails:
+            self.users.update(
+                get_user_model().objects.filter(
+                    email__in=emails,
+                ).values_list('email', 'id')
+            )
+
+    def _link(self, recipes, rows, field_name, model):
+        """ Create missing names and insert the through rows of a chunk """
+        ids = self.names[model]
+        missing = {
+            (row['user_id'], name)
+            for row in rows
+            for name in row[field_name]
+        } - ids.keys()
+        if missing:
+            model.objects.bulk_create(
+                [model(user_id=user, name=name) for user, name in missing],
+                ignore_conflicts=True,
+            )
+            found = model.objects.filter(
+                user_id__in={user for user, _ in missing},
+                name__in={name for _, name in missing},
+            ).values_list('user_id', 'name', 'id')
+            ids.update(
+                ((user, name), pk) for user, name, pk in found
+                if (user, name) in missing
+            )
+
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_column_name()
+        target = field.m2m_reverse_name()
+        through.objects.bulk_create([
+            through(**{
+                source: recipe.pk,
+                target: ids[(row['user_id'], name)],
+            })
+            for recipe, row in zip(recipes, rows)
+            for name in row[field_name]
+        ])
@@ -0,0 +1,142 @@
+# View mixins for the recipe APIs
+
+import hashlib
+from functools import partial
+
+from django.db.models import Count, Max
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+
+from rest_framework.response import Response
+
+from recipe.cache import response_cache
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and detail GETs with 304 Not Modified when the client's
+    copy is still current, without serializing anything.
+
+    Validators come from one aggregate over the filtered queryset: the
+    latest `updated_at` plus the row count, so edits, additions and
+    deletions all change the ETag. Details also send Last-Modified. Lists
+    do not, because a deletion never moves max(updated_at) forward.
+    Views whose rows also depend on other tables add their state with
+    get_extra_validators().
+    """
+
+    def get_extra_validators(self, queryset):
+        """ Return more values the ETag of a queryset depends on """
+        return []
+
+    def get_validators(self, queryset):
+        """ Return (etag, last_modified) for the rows of a queryset """
+        stats = queryset.order_by().aggregate(
+            last_modified=Max('updated_at'),
+            count=Count('pk'),
+        )
+        last_modified = stats['last_modified']
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        parts = [
+            self.request.path,
+            sorted(self.request.query_params.lists()),
+            getattr(renderer, 'media_type', ''),
+            self.request.user.pk,
+            stats['count'],
+            last_modified.isoformat() if last_modified else '',
+            *self.get_extra_validators(queryset),
+        ]
+        etag = hashlib.md5(repr(parts).encode()).hexdigest()
+        return etag, last_modified
+
+    def _conditional(self, queryset, response_func, send_last_modified):
+        """ Return 304 if the client copy matches, else the response """
+        etag, last_modified = self.get_validators(queryset)
+        if not send_last_modified:
+            last_modified = None
+        timestamp = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+        response = get_conditional_response(
+            self.request,
+            etag=quote_etag(etag),
+            last_modified=timestamp,
+        )
+        if response is None:
+            response = response_func()
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional(
+            queryset,
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            ),
+            send_last_modified=False,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return self._conditional(
+            queryset,
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+            send_last_modified=True,
+        )
+
+
+class CachedListMixin:
+    """
+    Serve list responses from the per-user response cache.
+
+    The cached entry keeps the response data and its ETag, so a hit needs
+    no database query at all, including for If-None-Match revalidation.
+    Compressed bodies are kept next to the entry for the compression
+    middleware.
+    Place it before ConditionalGetMixin so misses still get validators.
+    """
+
+    def list(self, request, *args, **kwargs):
+        key = response_cache.make_key(request)
+        entry = response_cache.get(key)
+        if entry is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code == 200:
+                response_cache.set(key, {
+                    'data': response.data,
+                    'etag': response.get('ETag'),
+                })
+                response.store_compressed = partial(
+                    response_cache.set_body, key,
+                )
+            return response
+
+        etag = entry['etag']
+        response = None
+        if etag:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(entry['data'])
+            # Let the compression middleware reuse compressed bodies.
+            response.load_compressed = partial(response_cache.get_body, key)
+            response.store_compressed = partial(response_cache.set_body, key)
+        if etag:
+            response['ETag'] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Accept'])
+        return response
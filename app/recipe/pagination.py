@@ -0,0 +1,43 @@
+# Pagination classes for the recipe APIs
+
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Keyset pagination that is only applied when the client asks for it.
+
+    Sending `cursor` or `page_size` switches the list endpoint to opaque
+    cursor pages, which filter on the ordering column (`WHERE id < x`)
+    instead of using OFFSET, so every page costs the same as the first.
+    Without those parameters the full list is returned as before.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """ Paginate only when a cursor or page size is requested """
+        params = request.query_params
+        if (
+            self.cursor_query_param not in params
+            and self.page_size_query_param not in params
+        ):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(OptInCursorPagination):
+    """ Cursor pagination for recipes, newest first """
+    ordering = '-id'
+
+    def get_ordering(self, request, queryset, view):
+        """ Page search results by relevance, then newest first """
+        if request.query_params.get('search'):
+            return ('-rank', '-id')
+        return super().get_ordering(request, queryset, view)
+
+
+class RecipeAttrCursorPagination(OptInCursorPagination):
+    """ Cursor pagination for tags and ingredients, by name """
+    ordering = '-name'
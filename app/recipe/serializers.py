@@ -1,13 +1,161 @@
 # Serializers for recipe API
 
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from core.signals import batch_recipe_changes
 from core.models import (
+    ImageBlob,
     Recipe,
     Tag,
     Ingredient
 )
+from recipe.cache import fragment_cache, response_cache
+from recipe.images import release_variants, variant_urls
+
+
+def recipe_prefetches():
+    """ Return the prefetches needed to serialize recipes """
+    return [
+        Prefetch(
+            'tags',
+            queryset=Tag.objects.only('id', 'name').order_by('id'),
+        ),
+        Prefetch(
+            'ingredients',
+            queryset=Ingredient.objects.only('id', 'name').order_by('id'),
+        ),
+    ]
+
+
+def related_rows(field_name, recipe_ids, names):
+    """
+    Return {recipe id: [{name: value}]} with the given columns of one
+    relation of some recipes, read from the through table in one query
+    and in the same order as recipe_prefetches().
+    """
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_column_name()
+    target = field.m2m_reverse_field_name()
+    related = {}
+    rows = through.objects.filter(
+        **{f'{source}__in': recipe_ids}
+    ).order_by(f'{target}__id').values_list(
+        source, *[f'{target}__{name}' for name in names]
+    )
+    for recipe_id, *values in rows:
+        related.setdefault(recipe_id, []).append(dict(zip(names, values)))
+    return related
+
 
-class IngredientSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Let read requests pick the fields of a model serializer.
+
+    ?fields=a,b keeps only the named fields, ?omit=a,b drops them and
+    ?expand=a adds fields listed in Meta.expandable_fields. Only the
+    top level serializer (or the child of a top level list) is pruned,
+    nested serializers keep all their fields.
+    """
+
+    def _field_params(self):
+        """ Return (fields, omit, expand) or None if they do not apply """
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        root = self.root
+        if root is not self and not (
+            isinstance(root, serializers.ListSerializer)
+            and self.parent is root
+        ):
+            return None
+
+        def names(param):
+            value = request.query_params.get(param)
+            if value is None:
+                return None
+            return [name.strip() for name in value.split(',') if name.strip()]
+
+        return names('fields'), names('omit'), names('expand') or []
+
+    def get_field_names(self, declared_fields, info):
+        names = list(super().get_field_names(declared_fields, info))
+        params = self._field_params()
+        if params is None:
+            return names
+        expandable = getattr(self.Meta, 'expandable_fields', [])
+        unknown = [name for name in params[2] if name not in expandable]
+        if unknown:
+            raise serializers.ValidationError(
+                {'expand': f'Unknown fields: {", ".join(unknown)}.'}
+            )
+        return names + [name for name in params[2] if name not in names]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        params = self._field_params()
+        if params is None:
+            return fields
+        only, omit, _ = params
+        for param, names in (('fields', only), ('omit', omit)):
+            unknown = [name for name in names or [] if name not in fields]
+            if unknown:
+                raise serializers.ValidationError(
+                    {param: f'Unknown fields: {", ".join(unknown)}.'}
+                )
+        if only is not None:
+            fields = type(fields)(
+                (name, field) for name, field in fields.items()
+                if name in only
+            )
+        for name in omit or []:
+            fields.pop(name)
+        return fields
+
+    def selected_columns(self):
+        """
+        Return the model columns read by the selected fields, for only().
+        Meta.field_sources names the columns of fields without a source.
+        """
+        columns = {
+            field.name for field in self.Meta.model._meta.concrete_fields
+        }
+        sources = getattr(self.Meta, 'field_sources', {})
+        selected = {'id'}
+        for name, field in self.fields.items():
+            selected.update(
+                source for source in sources.get(name, [field.source])
+                if source in columns
+            )
+        return selected
+
+
+class BaseRecipeAttrSerializer(
+    SparseFieldsMixin,
+    serializers.ModelSerializer,
+):
+    """ Base serializer for recipe attributes """
+
+    def validate_name(self, value):
+        """ Reject renaming onto a name the user already has """
+        if self.instance is not None:
+            duplicate = type(self.instance).objects.filter(
+                user=self.instance.user,
+                name=value,
+            ).exclude(id=self.instance.id)
+            if duplicate.exists():
+                raise serializers.ValidationError(
+                    'You already have an item with this name.'
+                )
+        return value
+
+
+class IngredientSerializer(BaseRecipeAttrSerializer):
     """ Serializer for ingredients """
 
     class Meta:
@@ -15,7 +163,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(BaseRecipeAttrSerializer):
     """ Serializer for Tag """
 
     class Meta:
@@ -23,63 +171,323 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
         read_only_fields = ['id']
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(serializers.ListSerializer):
+    """
+    Serialize many recipes from the fragment cache.
+
+    Each recipe's representation is cached under its id and updated_at,
+    which every change to the recipe or to its tags and ingredients
+    bumps, so stale fragments are never looked up again. Cached
+    fragments are read with one multi-get; only the misses are
+    serialized.
+
+    Recipes may be model instances or values() rows. Rows take a fast
+    path that builds the same representation without the per-object
+    serializer machinery.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if hasattr(data, 'all') else data
+        items = list(iterable)
+        keys = [self._fragment_key(item) for item in items]
+        fragments = fragment_cache.get_many(keys)
+
+        misses = {
+            key: item
+            for item, key in zip(items, keys)
+            if key not in fragments
+        }
+        if misses:
+            render = (
+                self._render_rows
+                if isinstance(items[0], dict)
+                else self._render_instances
+            )
+            rendered = dict(zip(misses, render(list(misses.values()))))
+            fragment_cache.set_many(rendered)
+            fragments.update(rendered)
+        return [fragments[key] for key in keys]
+
+    def _render_instances(self, instances):
+        """ Serialize model instances through the child serializer """
+        prefetches = [
+            prefetch for prefetch in recipe_prefetches()
+            if prefetch.prefetch_to in self.child.fields
+        ]
+        if prefetches:
+            prefetch_related_objects(instances, *prefetches)
+        return [self.child.to_representation(obj) for obj in instances]
+
+    def _render_rows(self, rows):
+        """
+        Build the child serializer's representation of values() rows.
+
+        Column fields only go through their field's to_representation,
+        and not even that for strings and integers, which the database
+        already returns as such. Nested tags and ingredients come from
+        one query each. Method fields get an object with the row's
+        values as attributes.
+        """
+        ids = [row['id'] for row in rows]
+        readers = []
+        for name, field in self.child.fields.items():
+            if isinstance(field, serializers.ListSerializer):
+                related = related_rows(
+                    field.source, ids, list(field.child.fields),
+                )
+                readers.append((name, 'related', related))
+            elif isinstance(field, serializers.SerializerMethodField):
+                method = getattr(self.child, field.method_name)
+                readers.append((name, 'method', method))
+            elif isinstance(
+                field, (serializers.CharField, serializers.IntegerField)
+            ):
+                readers.append((name, 'column', field.source))
+            else:
+                readers.append((name, 'field', field))
+
+        representations = []
+        for row in rows:
+            obj = None
+            data = {}
+            for name, kind, reader in readers:
+                if kind == 'column':
+                    data[name] = row[reader]
+                elif kind == 'related':
+                    data[name] = reader.get(row['id'], [])
+                elif kind == 'method':
+                    if obj is None:
+                        obj = SimpleNamespace(**row)
+                    data[name] = reader(obj)
+                else:
+                    value = row[reader.source]
+                    data[name] = (
+                        None if value is None
+                        else reader.to_representation(value)
+                    )
+            representations.append(data)
+        return representations
+
+    def create(self, validated_data):
+        """
+        Create many recipes with one INSERT for the recipes, one upsert
+        per tag and ingredient table and one INSERT per through table.
+        """
+        items = [dict(attrs) for attrs in validated_data]
+        tag_lists = [item.pop('tags', []) for item in items]
+        ingredient_lists = [item.pop('ingredients', []) for item in items]
+        recipes = Recipe.objects.bulk_create(
+            [Recipe(**item) for item in items]
+        )
+        self._write_relations(recipes, 'tags', Tag, tag_lists, new=True)
+        self._write_relations(
+            recipes, 'ingredients', Ingredient, ingredient_lists, new=True,
+        )
+        self._mark_changed(recipes)
+        return recipes
+
+    def update(self, instances, validated_data):
+        """
+        Partially update many recipes, given as a list parallel to
+        validated_data, with one UPDATE for the recipe columns and only
+        the through rows that differ inserted or deleted.
+        """
+        fields = set()
+        tag_lists = []
+        ingredient_lists = []
+        for instance, attrs in zip(instances, validated_data):
+            attrs = dict(attrs)
+            tag_lists.append(attrs.pop('tags', None))
+            ingredient_lists.append(attrs.pop('ingredients', None))
+            for attr, value in attrs.items():
+                setattr(instance, attr, value)
+                fields.add(attr)
+        if fields:
+            Recipe.objects.bulk_update(instances, sorted(fields))
+        self._write_relations(instances, 'tags', Tag, tag_lists)
+        self._write_relations(
+            instances, 'ingredients', Ingredient, ingredient_lists,
+        )
+        self._mark_changed(instances)
+        return instances
+
+    def _write_relations(
+        self, recipes, field_name, model, item_lists, new=False,
+    ):
+        """
+        Link each recipe to the tags or ingredients named in the parallel
+        item_lists, where None leaves a recipe's links untouched. Names
+        of all recipes are resolved together. New recipes have no links
+        to diff against.
+        """
+        changed = [
+            (recipe, items)
+            for recipe, items in zip(recipes, item_lists)
+            if items is not None
+        ]
+        if not changed:
+            return
+        objs = {
+            obj.name: obj
+            for obj in self.child._get_or_create_attrs(
+                model,
+                [item for _, items in changed for item in items],
+            )
+        }
+        wanted = {
+            (recipe.pk, objs[item['name']].pk)
+            for recipe, items in changed
+            for item in items
+        }
+
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_column_name()
+        target = field.m2m_reverse_name()
+        existing = {} if new else {
+            (recipe_id, related_id): pk
+            for pk, recipe_id, related_id in through.objects.filter(
+                **{f'{source}__in': [recipe.pk for recipe, _ in changed]}
+            ).values_list('pk', source, target)
+        }
+        stale = [pk for pair, pk in existing.items() if pair not in wanted]
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        through.objects.bulk_create([
+            through(**{source: recipe_id, target: related_id})
+            for recipe_id, related_id in sorted(wanted - existing.keys())
+        ])
+
+    def _mark_changed(self, recipes):
+        """ Do what the per-object signals would have done """
+        if not recipes:
+            return
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes]
+        ).mark_changed()
+        response_cache.invalidate(recipes[0].user_id)
+
+    def _fragment_key(self, item):
+        """ Return the cache key of one recipe's representation """
+        if isinstance(item, dict):
+            pk, updated_at = item['id'], item['updated_at']
+        else:
+            pk, updated_at = item.pk, item.updated_at
+        # Image URLs are absolute, so fragments differ between hosts.
+        request = self.context.get('request')
+        origin = request.build_absolute_uri('/') if request else ''
+        return fragment_cache.make_key(
+            self.child,
+            pk,
+            f'{updated_at.isoformat()}:{self.child.image_size}:{origin}',
+        )
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipe."""
     tags = TagSerializer(many=True, required=False)
     ingredients = IngredientSerializer(many=True,required=False)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'title', 'time_minutes', 'price', 'link', 'tags',
-            'ingredients',
+            'ingredients', 'image_variants',
             ]
         read_only_fields = ['id']
+        list_serializer_class = RecipeListSerializer
+        expandable_fields = ['description']
+        field_sources = {'image_variants': ['image', 'image_variants']}
 
-    def _get_or_create_tags(self, tags, recipe):
-        """ Handle getting or creating tags as needed"""
+    @property
+    def image_size(self):
+        """ Return the variant width requested with ?image_size= """
+        request = self.context.get('request')
+        if request is None:
+            return None
+        try:
+            return int(request.query_params['image_size'])
+        except (KeyError, ValueError):
+            return None
+
+    def get_image_variants(self, obj):
+        """ Return the URLs of the resized copies of the image """
+        return variant_urls(
+            obj, self.image_size, self.context.get('request'),
+        )
+
+    def _get_or_create_attrs(self, model, items):
+        """
+        Resolve tag or ingredient names to the user's objects.
+
+        Existing names are read in one query and the missing ones are
+        inserted with one bulk insert. Conflicting inserts from concurrent
+        requests are ignored and picked up by re-reading the new names,
+        so the (user, name) unique constraint never surfaces as an error.
+        """
         auth_user = self.context['request'].user
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
+        names = list(dict.fromkeys(item['name'] for item in items))
+        if not names:
+            return []
+        objs = {
+            obj.name: obj
+            for obj in model.objects.filter(user=auth_user, name__in=names)
+        }
+        missing = [name for name in names if name not in objs]
+        if missing:
+            model.objects.bulk_create(
+                [model(user=auth_user, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            objs.update(
+                (obj.name, obj)
+                for obj in model.objects.filter(
+                    user=auth_user,
+                    name__in=missing,
+                )
             )
-            recipe.tags.add(tag_obj)
+        return [objs[name] for name in names]
+
+    def _get_or_create_tags(self, tags, recipe):
+        """ Handle getting or creating tags as needed"""
+        recipe.tags.add(*self._get_or_create_attrs(Tag, tags))
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """ Handle getting or creating ingredients as needed"""
-        auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient,
-            )
-            recipe.ingredients.add(ingredient_obj)
-
+        recipe.ingredients.add(
+            *self._get_or_create_attrs(Ingredient, ingredients)
+        )
 
     def create(self, validated_data):
         """ crea a recipe """
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
-        recipe = Recipe.objects.create(**validated_data)
-        self._get_or_create_tags(tags,recipe)
-        self._get_or_create_ingredients(ingredients,recipe)
+        with batch_recipe_changes():
+            recipe = Recipe.objects.create(**validated_data)
+            self._get_or_create_tags(tags,recipe)
+            self._get_or_create_ingredients(ingredients,recipe)
         return  recipe
 
     def update(self, instance ,validated_data):
-        """ updatin recipe """
-        tags = validated_data.pop('tags', [])
-        ingredients = validated_data.pop('ingredients', [])
-        if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
-        if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
-        for attr, value in validated_data.items():
-            setattr(instance,attr, value)
-
-        instance.save()
+        """
+        Update a recipe, diffing tags and ingredients against the stored
+        ones so only added or removed through rows are written. Relations
+        that are absent from the payload are left untouched.
+        """
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        with batch_recipe_changes():
+            if tags is not None:
+                instance.tags.set(self._get_or_create_attrs(Tag, tags))
+            if ingredients is not None:
+                instance.ingredients.set(
+                    self._get_or_create_attrs(Ingredient, ingredients)
+                )
+            for attr, value in validated_data.items():
+                setattr(instance,attr, value)
+
+            instance.save()
         return instance
 
 
@@ -89,6 +497,14 @@ class RecipeDetailSerializer(RecipeSerializer):
     class Meta(RecipeSerializer.Meta):
         fields = RecipeSerializer.Meta.fields + ['description']
 
+class RecipeBulkDeleteSerializer(serializers.Serializer):
+    """ Serializer for the ids of recipes to delete in bulk """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+    )
+
+
 class RecipeImageSerializer(serializers.ModelSerializer):
     """ Serializer for uploading images for recipe """
 
@@ -97,3 +513,15 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+    def update(self, instance, validated_data):
+        """ Replace the image, moving the reference to the new file """
+        previous = instance.image.name
+        with transaction.atomic():
+            # Saving the new file took its reference, under a lock held
+            # until this transaction commits.
+            instance = super().update(instance, validated_data)
+            ImageBlob.objects.release(previous)
+            if previous != instance.image.name:
+                release_variants(previous)
+        return instance
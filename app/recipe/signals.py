@@ -0,0 +1,37 @@
+# Signal handlers for the recipe app
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import (
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.cache import response_cache
+from recipe.images import release_variants
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_write(sender, instance, **kwargs):
+    """ Drop the cached lists of the owner of a changed object """
+    response_cache.invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_relation_change(sender, instance, action, **kwargs):
+    """ Drop the cached lists of a user whose recipe relations changed """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        response_cache.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_variants_on_delete(sender, instance, **kwargs):
+    """ Delete the variants of a deleted recipe's image once unused """
+    release_variants(instance.image.name)
@@ -0,0 +1,406 @@
+""" Tests for the recipe management commands """
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connections
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+
+from core.models import (
+    ImageBlob,
+    ImportCheckpoint,
+    Recipe,
+    Tag,
+    Ingredient,
+)
+from recipe.images import delete_image_files
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Tests for the import_recipes command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _write(self, name, content):
+        """Write an input file and return its path."""
+        path = os.path.join(self.tempdir.name, name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def _jsonl(self, records):
+        """Write records as JSON lines and return the path."""
+        return self._write(
+            'recipes.jsonl',
+            ''.join(json.dumps(record) + '\n' for record in records),
+        )
+
+    def _import(self, path, *args):
+        """Run the command and return its stdout and stderr."""
+        out, err = StringIO(), StringIO()
+        call_command('import_recipes', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_jsonl(self):
+        """Test importing recipes with shared tags and ingredients."""
+        Tag.objects.create(user=self.user, name='Dinner')
+        path = self._jsonl([
+            {
+                'user': 'user@example.com',
+                'title': f'Curry {i}',
+                'time_minutes': 30,
+                'price': '5.50',
+                'tags': ['Dinner', 'Spicy'],
+                'ingredients': [{'name': 'Rice'}],
+            }
+            for i in range(5)
+        ])
+
+        out, _ = self._import(path, '--chunk-size', '2')
+
+        self.assertIn('Imported 5 recipes', out)
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 5)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        recipe = recipes.get(title='Curry 3')
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()),
+            ['Dinner', 'Spicy'],
+        )
+        self.assertTrue(
+            recipes.filter(search_vector='curry').exists()
+        )
+
+    def test_import_csv(self):
+        """Test importing recipes from CSV with a default owner."""
+        path = self._write(
+            'recipes.csv',
+            'title,time_minutes,price,tags,ingredients\n'
+            'Soup,20,3.00,Lunch|Vegan,Carrot|Onion\n',
+        )
+
+        self._import(path, '--user', 'user@example.com')
+
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.title, 'Soup')
+        self.assertEqual(
+            sorted(i.name for i in recipe.ingredients.all()),
+            ['Carrot', 'Onion'],
+        )
+
+    def test_invalid_records_skipped(self):
+        """Test invalid records are reported and the rest imported."""
+        path = self._write(
+            'recipes.jsonl',
+            json.dumps({'title': 'Ok', 'time_minutes': 5, 'price': 1}) + '\n'
+            + 'not json\n'
+            + json.dumps({'title': 'No time', 'price': 1}) + '\n'
+            + json.dumps({
+                'user': 'nobody@example.com',
+                'title': 'Orphan', 'time_minutes': 5, 'price': 1,
+            }) + '\n',
+        )
+
+        out, err = self._import(path, '--user', 'user@example.com')
+
+        self.assertIn('Imported 1 recipes, skipped 3', out)
+        self.assertIn('Record 2:', err)
+        self.assertIn('Record 3: time_minutes', err)
+        self.assertIn('Record 4: unknown user', err)
+
+    def test_resume_after_checkpoint(self):
+        """Test a re-run continues after the committed records."""
+        path = self._jsonl([
+            {
+                'user': 'user@example.com',
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': 1,
+            }
+            for i in range(4)
+        ])
+        ImportCheckpoint.objects.create(
+            source=os.path.abspath(path),
+            position=3,
+        )
+
+        out, _ = self._import(path)
+        self._import(path)
+
+        self.assertIn('Resuming after 3 records', out)
+        titles = list(Recipe.objects.values_list('title', flat=True))
+        self.assertEqual(titles, ['Recipe 3'])
+
+    def test_resume_from_offset(self):
+        """Test a re-run seeks past the committed records unparsed."""
+        records = [
+            {
+                'user': 'user@example.com',
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': 1,
+            }
+            for i in range(5)
+        ]
+        path = self._jsonl(records[:3])
+        self._import(path)
+        with open(path, 'a', encoding='utf-8') as handle:
+            handle.write(''.join(json.dumps(r) + '\n' for r in records[3:]))
+
+        with patch(
+            'recipe.management.commands.import_recipes.json.loads',
+            wraps=json.loads,
+        ) as loads:
+            out, _ = self._import(path)
+
+        self.assertEqual(loads.call_count, 2)
+        self.assertIn('Resuming after 3 records', out)
+        self.assertIn('5 records read', out)
+        self.assertEqual(Recipe.objects.count(), 5)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.offset, os.path.getsize(path))
+
+    def test_resume_csv_from_offset(self):
+        """Test a CSV re-run keeps the header and continues after it."""
+        path = self._write(
+            'recipes.csv',
+            'title,time_minutes,price,tags,ingredients\n'
+            'Soup,20,3.00,Lunch,Carrot\n'
+            '"Stew\nwith rice",40,4.00,Dinner,Rice\n',
+        )
+        self._import(path, '--user', 'user@example.com')
+        with open(path, 'a', encoding='utf-8') as handle:
+            handle.write('Salad,10,2.00,Lunch,Lettuce\n')
+
+        out, err = self._import(path, '--user', 'user@example.com')
+
+        self.assertIn('3 records read', out)
+        self.assertEqual(err, '')
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('title', flat=True)),
+            ['Salad', 'Soup', 'Stew\nwith rice'],
+        )
+        salad = Recipe.objects.get(title='Salad')
+        self.assertEqual(salad.tags.get().name, 'Lunch')
+
+
+class GcImageBlobsCommandTests(TestCase):
+    """Tests for the gc_image_blobs command."""
+
+    def _blob(self, refcount, age_minutes):
+        """Store a file with a blob row of the given count and age."""
+        name = default_storage.save(
+            'uploads/recipe/gc/test.jpg', ContentFile(b'image'),
+        )
+        self.addCleanup(default_storage.delete, name)
+        ImageBlob.objects.create(name=name, refcount=refcount)
+        ImageBlob.objects.filter(name=name).update(
+            updated_at=timezone.now() - timedelta(minutes=age_minutes),
+        )
+        return name
+
+    def test_deletes_old_unreferenced_files(self):
+        """Test unreferenced files past the grace period are deleted."""
+        old = self._blob(refcount=0, age_minutes=120)
+        recent = self._blob(refcount=0, age_minutes=5)
+        used = self._blob(refcount=1, age_minutes=120)
+
+        call_command('gc_image_blobs', stdout=StringIO())
+
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(ImageBlob.objects.filter(name=old).exists())
+        self.assertTrue(default_storage.exists(recent))
+        self.assertTrue(default_storage.exists(used))
+
+    def test_dry_run_keeps_files(self):
+        """Test a dry run only lists the files."""
+        name = self._blob(refcount=0, age_minutes=120)
+        out = StringIO()
+
+        call_command('gc_image_blobs', '--dry-run', stdout=out)
+
+        self.assertIn(name, out.getvalue())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_repairs_count_of_used_file(self):
+        """Test a file still used by a recipe is kept and recounted."""
+        name = self._blob(refcount=0, age_minutes=120)
+        user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        Recipe.objects.create(
+            user=user, title='r', time_minutes=1, price=1, image=name,
+        )
+
+        call_command('gc_image_blobs', stdout=StringIO())
+
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+
+class GcImageBlobsRaceTests(TransactionTestCase):
+    """Test uploads racing with the gc_image_blobs command."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def _recipe(self):
+        return Recipe.objects.create(
+            user=self.user, title='r', time_minutes=1, price=1,
+        )
+
+    def test_upload_during_collection_keeps_file(self):
+        """Test an upload reusing a file being collected rewrites it."""
+        content = b'same image'
+        first = self._recipe()
+        first.image.save('photo.jpg', ContentFile(content))
+        name = first.image.name
+        self.addCleanup(delete_image_files, name)
+        first.delete()
+        ImageBlob.objects.update_or_create(name=name, defaults={
+            'refcount': 0,
+        })
+        ImageBlob.objects.filter(name=name).update(
+            updated_at=timezone.now() - timedelta(minutes=120),
+        )
+        collecting = threading.Event()
+
+        def slow_delete(name):
+            # Hold the blob's lock a while, as a large batch would.
+            collecting.set()
+            time.sleep(0.2)
+            delete_image_files(name)
+
+        def collect():
+            try:
+                with patch(
+                    'recipe.management.commands.gc_image_blobs.'
+                    'delete_image_files',
+                    slow_delete,
+                ):
+                    call_command('gc_image_blobs', stdout=StringIO())
+            finally:
+                connections.close_all()
+
+        collector = threading.Thread(target=collect)
+        collector.start()
+        collecting.wait(5)
+        second = self._recipe()
+        second.image.save('photo.jpg', ContentFile(content))
+        collector.join()
+
+        self.assertEqual(second.image.name, name)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+
+class GcMediaCommandTests(TestCase):
+    """Tests for the gc_media command."""
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+
+    def _file(self, name, age_minutes=120):
+        """Create a media file with the given age and return its name."""
+        path = os.path.join(self.media.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(b'image')
+        mtime = (timezone.now() - timedelta(minutes=age_minutes)).timestamp()
+        os.utime(path, (mtime, mtime))
+        return name
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self.media.name, name))
+
+    def _files(self):
+        """Create one file of every kind and return their names."""
+        names = {
+            'orphan': self._file('uploads/recipe/ab/orphan.jpg'),
+            'used': self._file('uploads/recipe/cd/used.jpg'),
+            'blob': self._file('uploads/recipe/ef/blob.jpg'),
+            'new': self._file('uploads/recipe/ab/new.jpg', age_minutes=1),
+            'variant': self._file('uploads/recipe/cd/variants/used-128.jpeg'),
+            'stale_variant': self._file(
+                'uploads/recipe/ab/variants/gone-128.jpeg',
+            ),
+        }
+        Recipe.objects.create(
+            user=self.user, title='r', time_minutes=1, price=1,
+            image=names['used'],
+        )
+        ImageBlob.objects.create(name=names['blob'], refcount=0)
+        return names
+
+    def test_removes_orphans(self):
+        """Test only unreferenced, old files are removed."""
+        names = self._files()
+        out = StringIO()
+
+        call_command('gc_media', stdout=out)
+
+        self.assertIn('Removed 2 orphans', out.getvalue())
+        self.assertFalse(self._exists(names['orphan']))
+        self.assertFalse(self._exists(names['stale_variant']))
+        for kind in ['used', 'blob', 'new', 'variant']:
+            self.assertTrue(self._exists(names[kind]), kind)
+
+    def test_dry_run(self):
+        """Test a dry run lists orphans without touching them."""
+        names = self._files()
+        out = StringIO()
+
+        call_command('gc_media', '--dry-run', '--batch-size', '2', stdout=out)
+
+        self.assertIn(names['orphan'], out.getvalue())
+        self.assertTrue(self._exists(names['orphan']))
+
+    def test_quarantine(self):
+        """Test orphans can be moved aside instead of deleted."""
+        names = self._files()
+        quarantine = os.path.join(self.media.name, 'quarantine')
+
+        call_command(
+            'gc_media', '--quarantine', quarantine, stdout=StringIO(),
+        )
+
+        self.assertFalse(self._exists(names['orphan']))
+        self.assertTrue(
+            os.path.exists(os.path.join(quarantine, names['orphan']))
+        )
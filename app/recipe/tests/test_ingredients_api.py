@@ -16,6 +16,7 @@ from recipe.serializers import IngredientSerializer
 
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
 
 def detail_url(ingredient_id):
     """ Create and return an ingredient detail URL """
@@ -71,6 +72,20 @@ class PrivateIngredientsApiTests(TestCase):
         self.assertEqual(res.data[0]['name'], ingredient.name)
         self.assertEqual(res.data[0]['id'], ingredient.id)
 
+    def test_ingredients_cursor_pagination(self):
+        """ Test paging through ingredients with a cursor """
+        for name in ['salt', 'rice', 'egg']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(INGREDIENTS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        names = [i['name'] for i in res.data['results']]
+        self.assertEqual(names, ['salt', 'rice'])
+        res = self.client.get(res.data['next'])
+        self.assertEqual([i['name'] for i in res.data['results']], ['egg'])
+        self.assertIsNone(res.data['next'])
+
     def test_update_ingredient(self):
         """ Test updating an ingredient """
         ingredient = Ingredient.objects.create(user=self.user, name='mincedmeat')
@@ -137,4 +152,46 @@ class PrivateIngredientsApiTests(TestCase):
 
         self.assertEqual(len(res.data), 1)
 
+    def test_autocomplete_ingredients(self):
+        """ Test completing ingredient names by prefix, then fuzzily """
+        for name in ['Tomato', 'tomato paste', 'Tomatillo', 'Rice']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tomato'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        names = [i['name'] for i in res.data]
+        self.assertEqual(names[:2], ['Tomato', 'tomato paste'])
+        self.assertEqual(names[2:], ['Tomatillo'])
+
+    def test_autocomplete_empty_query(self):
+        """ Test an empty query returns no completions """
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': ''})
+
+        self.assertEqual(res.data, [])
+
+    def test_list_cache_invalidated_by_create(self):
+        """ Test a new ingredient shows up in a previously cached list """
+        Ingredient.objects.create(user=self.user, name='Salt')
+        self.client.get(INGREDIENTS_URL)
+
+        Ingredient.objects.create(user=self.user, name='Pepper')
+        res = self.client.get(INGREDIENTS_URL)
+
+        self.assertEqual([i['name'] for i in res.data], ['Salt', 'Pepper'])
+
+    def test_list_fields(self):
+        """ Test the ingredient list can be limited to some fields """
+        obj = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(INGREDIENTS_URL, {'fields': 'id'})
+
+        self.assertEqual(res.data, [{'id': obj.id}])
+
+    def test_list_unknown_field(self):
+        """ Test unknown fields are rejected """
+        res = self.client.get(INGREDIENTS_URL, {'omit': 'secret'})
 
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,28 +1,41 @@
 # Test for recipe apis
 from decimal import Decimal
+import csv
+import json
 import tempfile
 import os
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 
 from core.models import (
+    ImageBlob,
     Recipe,
     Tag,
     Ingredient,
 )
+from recipe.cache import fragment_cache
+from recipe.checks import check_variant_formats
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
 )
+from recipe.views import RecipeViewSet
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_URL = reverse('recipe:recipe-bulk')
+EXPORT_URL = reverse('recipe:recipe-export')
 
 def detail_url(recipe_id):
     """Create and return a recipe detail url."""
@@ -103,6 +116,34 @@ class PrivateRecipeAPITest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_recipe_list_cursor_pagination(self):
+        """ Test paging through recipes with a cursor """
+        recipes = [
+            create_recipe(user=self.user, title=f'r{i}') for i in range(5)
+        ]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data['previous'])
+        ids = [r['id'] for r in res.data['results']]
+        next_url = res.data['next']
+        while next_url:
+            res = self.client.get(next_url)
+            self.assertLessEqual(len(res.data['results']), 2)
+            ids += [r['id'] for r in res.data['results']]
+            next_url = res.data['next']
+
+        self.assertEqual(ids, [r.id for r in reversed(recipes)])
+
+    def test_recipe_list_unpaginated_by_default(self):
+        """ Test list is not paginated unless requested """
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertIsInstance(res.data, list)
+
     def test_get_recipe_detail(self):
         """Test get recipe detail."""
         recipe = create_recipe(user=self.user)
@@ -254,6 +295,20 @@ class PrivateRecipeAPITest(TestCase):
             ).exists()
             self.assertTrue(does_exists)
 
+    def test_create_recipe_with_repeated_tag_names(self):
+        """ Test repeated tag names in a payload create one tag """
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 20,
+            'price': Decimal('2.5'),
+            'tags': [{'name': 'Dinner'}, {'name': 'Dinner'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
     def test_create_tag_on_update(self):
         """ Test creating tag when updating a recipe """
         recipe = create_recipe(user=self.user)
@@ -294,6 +349,18 @@ class PrivateRecipeAPITest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_partial_update_keeps_tags(self):
+        """ Test a patch without tags leaves the recipe tags alone """
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag)
+
+        payload = {'title': 'New title'}
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(recipe.tags.all()), [tag])
+
     def test_create_recipe_with_new_ingredient(self):
         """ Test creating a recipe with ingredient """
         payload = {
@@ -421,6 +488,861 @@ class PrivateRecipeAPITest(TestCase):
         self.assertIn(s2.data, res.data)
         self.assertNotIn(s3.data, res.data)
 
+    def test_filter_by_tags_no_duplicates(self):
+        """ Test a recipe matching several tags is listed once """
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name='tag1name')
+        tag2 = Tag.objects.create(user=self.user, name='tag2name')
+        recipe.tags.add(tag1, tag2)
+
+        res = self.client.get(RECIPES_URL, {'tags': f'{tag1.id},{tag2.id}'})
+
+        self.assertEqual([r['id'] for r in res.data], [recipe.id])
+
+    def test_filter_by_tags_match_all(self):
+        """ Test filtering recipes that have every requested tag """
+        r1 = create_recipe(user=self.user, title='r1title')
+        r2 = create_recipe(user=self.user, title='r2title')
+        tag1 = Tag.objects.create(user=self.user, name='tag1name')
+        tag2 = Tag.objects.create(user=self.user, name='tag2name')
+        r1.tags.add(tag1, tag2)
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [r1.id])
+
+    def test_filter_by_ingredients_match_all(self):
+        """ Test filtering recipes that have every requested ingredient """
+        r1 = create_recipe(user=self.user, title='r1title')
+        r2 = create_recipe(user=self.user, title='r2title')
+        in1 = Ingredient.objects.create(user=self.user, name='in1name')
+        in2 = Ingredient.objects.create(user=self.user, name='in2name')
+        r1.ingredients.add(in1)
+        r2.ingredients.add(in1, in2)
+
+        params = {'ingredients': f'{in1.id},{in2.id}', 'match': 'all'}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r['id'] for r in res.data], [r2.id])
+
+    def test_filter_invalid_match_error(self):
+        """ Test an unknown match mode is rejected """
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeSearchTests(TestCase):
+    """ Test full-text search over recipes """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, term, **params):
+        """ Return the ids of the recipes matching a search term """
+        res = self.client.get(RECIPES_URL, {'search': term, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        results = res.data['results'] if 'page_size' in params else res.data
+        return [r['id'] for r in results]
+
+    def test_search_title_and_description(self):
+        """ Test searching matches titles and descriptions """
+        r1 = create_recipe(user=self.user, title='Spicy curry')
+        r2 = create_recipe(
+            user=self.user,
+            title='Rice bowl',
+            description='Serve with a mild curry sauce',
+        )
+        create_recipe(user=self.user, title='Pancakes')
+
+        self.assertEqual(self._search('curries'), [r1.id, r2.id])
+
+    def test_search_tag_and_ingredient_names(self):
+        """ Test searching matches names of tags and ingredients """
+        recipe = create_recipe(user=self.user, title='Soup')
+        payload = {
+            'tags': [{'name': 'Vegan'}],
+            'ingredients': [{'name': 'Lentils'}],
+        }
+        self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(self._search('vegan'), [recipe.id])
+        self.assertEqual(self._search('lentil'), [recipe.id])
+
+    def test_search_follows_tag_rename_and_delete(self):
+        """ Test renaming or deleting a tag updates the search results """
+        recipe = create_recipe(user=self.user, title='Soup')
+        tag = Tag.objects.create(user=self.user, name='Winter')
+        recipe.tags.add(tag)
+
+        tag.name = 'Summer'
+        tag.save()
+        self.assertEqual(self._search('winter'), [])
+        self.assertEqual(self._search('summer'), [recipe.id])
+
+        tag.delete()
+        self.assertEqual(self._search('summer'), [])
+
+    def test_search_with_filters_and_pagination(self):
+        """ Test cursor pages of search results list every hit once """
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        recipes = []
+        for i in range(40):
+            # Eight distinct ranks, each shared by five recipes.
+            recipe = create_recipe(
+                user=self.user,
+                title=f'Curry {i}',
+                description=' '.join(['curry'] * (i % 8)),
+            )
+            recipe.tags.add(tag)
+            recipes.append(recipe)
+        create_recipe(user=self.user, title='Curry without tag')
+
+        ids = []
+        res = self.client.get(RECIPES_URL, {
+            'search': 'curry', 'tags': str(tag.id), 'page_size': 3,
+        })
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids += [r['id'] for r in res.data['results']]
+            if not res.data['next'] or len(ids) > len(recipes):
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(sorted(ids), sorted(r.id for r in recipes))
+        by_relevance = sorted(
+            recipes, key=lambda r: (-r.description.count('curry'), -r.id),
+        )
+        self.assertEqual(ids, [r.id for r in by_relevance])
+
+
+class RecipeConditionalGetTests(TestCase):
+    """ Test ETag and Last-Modified handling of the recipe endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_list_returns_etag(self):
+        """ Test the recipe list sends a private ETag """
+        create_recipe(user=self.user)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', res)
+        self.assertNotIn('Last-Modified', res)
+        self.assertIn('private', res['Cache-Control'])
+
+    def test_list_not_modified(self):
+        """ Test a matching If-None-Match skips serialization """
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+        self.assertEqual(res.content, b'')
+
+    def test_list_etag_changes_on_write(self):
+        """ Test editing or deleting a recipe changes the list ETag """
+        recipe = create_recipe(user=self.user)
+        other = create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)['ETag']
+
+        self.client.patch(detail_url(recipe.id), {'title': 'New'})
+        second = self.client.get(RECIPES_URL)['ETag']
+        other.delete()
+        third = self.client.get(RECIPES_URL)['ETag']
+
+        self.assertEqual(len({first, second, third}), 3)
+
+    def test_list_etag_depends_on_query(self):
+        """ Test filtered lists do not share an ETag with the full list """
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'search': 'missing'},
+            HTTP_IF_NONE_MATCH=etag,
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_detail_etag_changes_on_tag_rename(self):
+        """ Test renaming a tag invalidates recipes that use it """
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'Vegetarian')
+
+    def test_detail_if_modified_since(self):
+        """ Test the detail endpoint honours If-Modified-Since """
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        last_modified = self.client.get(url)['Last-Modified']
+
+        res = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_is_per_user(self):
+        """ Test an ETag from another user's list is not honoured """
+        other = create_user(email='other@example.com', password='pass123')
+        client = APIClient()
+        client.force_authenticate(other)
+        etag = client.get(RECIPES_URL)['ETag']
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class RecipeResponseCacheTests(TestCase):
+    """ Test the per-user cache of recipe list responses """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_is_cached(self):
+        """ Test listing twice only queries the database once """
+        create_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_cache_keyed_by_query_params(self):
+        """ Test different filters are cached separately """
+        create_recipe(user=self.user, title='Curry')
+        create_recipe(user=self.user, title='Soup')
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry'})
+
+        self.assertEqual([r['title'] for r in res.data], ['Curry'])
+
+    def test_write_invalidates_cache(self):
+        """ Test creating, editing and deleting recipes are seen at once """
+        recipe = create_recipe(user=self.user, title='Curry')
+        self.client.get(RECIPES_URL)
+
+        self.client.patch(detail_url(recipe.id), {'title': 'Stew'})
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['title'], 'Stew')
+
+        recipe.delete()
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data, [])
+
+    def test_tag_changes_invalidate_cache(self):
+        """ Test adding and renaming tags are seen in the recipe list """
+        recipe = create_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(RECIPES_URL)
+
+        recipe.tags.add(tag)
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Vegan')
+
+        tag.name = 'Vegetarian'
+        tag.save()
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Vegetarian')
+
+    def test_cache_is_per_user(self):
+        """ Test users never see each other's cached lists """
+        create_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+        other = create_user(email='other@example.com', password='pass123')
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data, [])
+
+
+class RecipeFragmentCacheTests(TestCase):
+    """ Test the cache of serialized recipes used by the list """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_cached_fragments_skip_prefetch(self):
+        """ Test unchanged recipes are not serialized again """
+        for i in range(3):
+            recipe = create_recipe(user=self.user, title=f'recipe{i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f't{i}'))
+        first = self.client.get(RECIPES_URL)
+        # Invalidate the list response but none of the recipes.
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        with self.assertNumQueries(2):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(second.data, first.data)
+
+    def test_only_changed_recipe_is_serialized(self):
+        """ Test an edited recipe is rendered again, the rest reused """
+        recipe = create_recipe(user=self.user, title='Curry')
+        create_recipe(user=self.user, title='Soup')
+        self.client.get(RECIPES_URL)
+
+        self.client.patch(detail_url(recipe.id), {'title': 'Stew'})
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            [r['title'] for r in res.data],
+            ['Soup', 'Stew'],
+        )
+
+    def test_tag_rename_fans_out(self):
+        """ Test renaming a tag refreshes every recipe using it """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        for i in range(2):
+            create_recipe(user=self.user, title=f'r{i}').tags.add(tag)
+        self.client.get(RECIPES_URL)
+
+        res = self.client.patch(
+            reverse('recipe:tag-detail', args=[tag.id]),
+            {'name': 'Vegetarian'},
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.get(RECIPES_URL)
+
+        for recipe in res.data:
+            self.assertEqual(recipe['tags'][0]['name'], 'Vegetarian')
+
+
+class RecipeBulkApiTests(TestCase):
+    """ Test the bulk recipe endpoint """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, count, **params):
+        """ Return a list of recipe payloads sharing some names """
+        items = []
+        for i in range(count):
+            item = {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '2.50',
+                'tags': [{'name': 'Dinner'}, {'name': f'tag{i}'}],
+                'ingredients': [{'name': 'Salt'}],
+            }
+            item.update(params)
+            items.append(item)
+        return items
+
+    def test_bulk_create(self):
+        """ Test creating recipes with shared tags and ingredients """
+        Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.post(BULK_URL, self._payload(3), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        results = res.data['results']
+        self.assertEqual([r['status'] for r in results], [201] * 3)
+        self.assertEqual(
+            [r['data']['title'] for r in results],
+            ['Recipe 0', 'Recipe 1', 'Recipe 2'],
+        )
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        recipe = Recipe.objects.get(id=results[1]['data']['id'])
+        self.assertEqual(
+            sorted(tag.name for tag in recipe.tags.all()),
+            ['Dinner', 'tag1'],
+        )
+
+    def test_bulk_create_query_count_is_constant(self):
+        """ Test the number of queries does not grow with the items """
+        with self.assertNumQueries(15):
+            res = self.client.post(
+                BULK_URL,
+                self._payload(20),
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_create_reports_invalid_items(self):
+        """ Test invalid items are reported and valid ones created """
+        items = self._payload(2)
+        items.insert(1, {'title': 'No time'})
+
+        res = self.client.post(BULK_URL, items, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        results = res.data['results']
+        self.assertEqual([r['status'] for r in results], [201, 400, 201])
+        self.assertIn('time_minutes', results[1]['errors'])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_create_requires_list(self):
+        """ Test the payload must be a list """
+        res = self.client.post(BULK_URL, {'title': 'x'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_search_and_list_see_new_recipes(self):
+        """ Test bulk writes refresh search vectors and cached lists """
+        self.client.get(RECIPES_URL)
+
+        self.client.post(
+            BULK_URL,
+            self._payload(1, title='Thai curry'),
+            format='json',
+        )
+        res = self.client.get(RECIPES_URL, {'search': 'curry'})
+
+        self.assertEqual([r['title'] for r in res.data], ['Thai curry'])
+
+    def test_bulk_partial_update(self):
+        """ Test updating fields and tags of several recipes """
+        recipe1 = create_recipe(user=self.user, title='One')
+        recipe2 = create_recipe(user=self.user, title='Two')
+        recipe1.tags.add(Tag.objects.create(user=self.user, name='Old'))
+        payload = [
+            {'id': recipe1.id, 'tags': [{'name': 'New'}]},
+            {'id': recipe2.id, 'title': 'Second'},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, 'One')
+        self.assertEqual([t.name for t in recipe1.tags.all()], ['New'])
+        self.assertEqual(recipe2.title, 'Second')
+        self.assertEqual(res.data['results'][0]['data']['tags'][0]['name'],
+                         'New')
+
+    def test_bulk_partial_update_other_users_recipe(self):
+        """ Test recipes of other users are reported as not found """
+        other = create_user(email='other@example.com', password='pass123')
+        recipe = create_recipe(user=other, title='Theirs')
+
+        res = self.client.patch(
+            BULK_URL,
+            [{'id': recipe.id, 'title': 'Mine'}, {'title': 'No id'}],
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        statuses = [r['status'] for r in res.data['results']]
+        self.assertEqual(statuses, [404, 400])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Theirs')
+
+    def test_bulk_delete(self):
+        """ Test deleting recipes by id """
+        recipes = [create_recipe(user=self.user) for _ in range(2)]
+        other = create_recipe(
+            user=create_user(email='other@example.com', password='pass123')
+        )
+        ids = [recipes[0].id, recipes[1].id, other.id]
+
+        res = self.client.delete(BULK_URL, {'ids': ids}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_207_MULTI_STATUS)
+        statuses = [r['status'] for r in res.data['results']]
+        self.assertEqual(statuses, [204, 204, 404])
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+        self.assertTrue(Recipe.objects.filter(id=other.id).exists())
+
+
+class RecipeExportTests(TestCase):
+    """ Test streaming export of recipes """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _export(self, params=None):
+        """ Return the response and its streamed body as text """
+        res = self.client.get(EXPORT_URL, params or {})
+        return res, b''.join(res.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """ Test exporting recipes as JSON lines with their names """
+        recipe = create_recipe(user=self.user, title='Curry')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice')
+        )
+        create_recipe(
+            user=create_user(email='other@example.com', password='pass123')
+        )
+
+        res, body = self._export()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['title'], 'Curry')
+        self.assertEqual(records[0]['price'], '5.25')
+        self.assertEqual(records[0]['tags'], ['Spicy'])
+        self.assertEqual(records[0]['ingredients'], ['Rice'])
+
+    def test_export_csv(self):
+        """ Test exporting recipes as CSV """
+        recipe = create_recipe(user=self.user, title='Soup, hot')
+        for name in ['Lunch', 'Vegan']:
+            recipe.tags.add(Tag.objects.create(user=self.user, name=name))
+
+        res, body = self._export({'output': 'csv'})
+
+        self.assertEqual(res['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(rows[0]['title'], 'Soup, hot')
+        self.assertEqual(rows[0]['tags'], 'Lunch|Vegan')
+
+    def test_export_applies_filters(self):
+        """ Test the list filters narrow the export """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        create_recipe(user=self.user, title='Salad').tags.add(tag)
+        create_recipe(user=self.user, title='Steak')
+
+        _, body = self._export({'tags': str(tag.id)})
+
+        titles = [json.loads(line)['title'] for line in body.splitlines()]
+        self.assertEqual(titles, ['Salad'])
+
+    def test_export_invalid_output(self):
+        """ Test an unknown export format is rejected """
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch.object(RecipeViewSet, 'export_chunk_size', 2)
+    def test_export_queries_per_chunk(self):
+        """ Test names are fetched once per chunk, not per recipe """
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'r{i}')
+            recipe.tags.add(Tag.objects.create(user=self.user, name=f't{i}'))
+
+        with self.assertNumQueries(7):
+            _, body = self._export()
+
+        self.assertEqual(len(body.splitlines()), 5)
+
+
+class RecipeSparseFieldsTests(TestCase):
+    """ Test choosing recipe fields with ?fields=, ?omit= and ?expand= """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user, title='Curry')
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Hot'))
+
+    def test_list_fields(self):
+        """ Test only the requested fields are returned """
+        res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': self.recipe.id, 'title': 'Curry'}])
+
+    def test_list_omit(self):
+        """ Test omitted fields are left out """
+        res = self.client.get(RECIPES_URL, {'omit': 'tags,ingredients'})
+
+        self.assertNotIn('tags', res.data[0])
+        self.assertNotIn('ingredients', res.data[0])
+        self.assertEqual(res.data[0]['title'], 'Curry')
+
+    def test_list_expand_description(self):
+        """ Test the list can include the description """
+        res = self.client.get(RECIPES_URL, {'expand': 'description'})
+
+        self.assertEqual(
+            res.data[0]['description'],
+            self.recipe.description,
+        )
+        self.assertEqual(res.data[0]['tags'][0]['name'], 'Hot')
+
+    def test_detail_fields(self):
+        """ Test the detail view can be pruned too """
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            {'fields': 'title,description'},
+        )
+
+        self.assertEqual(set(res.data), {'title', 'description'})
+
+    def test_unknown_field_rejected(self):
+        """ Test asking for a field that does not exist """
+        for params in (
+            {'fields': 'id,secret'},
+            {'omit': 'secret'},
+            {'expand': 'user'},
+        ):
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fields_restrict_query(self):
+        """ Test pruned fields are not selected or prefetched """
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(len(queries), 2)
+        select = queries[-1]['sql']
+        self.assertIn('"core_recipe"."title"', select)
+        self.assertNotIn('"core_recipe"."price"', select)
+        self.assertNotIn('"core_recipe"."description"', select)
+
+    def test_fields_ignored_on_write(self):
+        """ Test ?fields= does not restrict what can be updated """
+        res = self.client.patch(
+            f'{detail_url(self.recipe.id)}?fields=id',
+            {'title': 'Stew'},
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'Stew')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Stew')
+
+
+class RecipeRowRepresentationTests(TestCase):
+    """ Test the values() row fast path of the recipe list serializer """
+
+    def setUp(self):
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        patcher = patch.object(fragment_cache, 'timeout', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        first = create_recipe(
+            user=self.user,
+            title='Curry',
+            price=Decimal('12.50'),
+            image_variants={'128': {'jpeg': 'uploads/recipe/ab/c-128.jpeg'}},
+        )
+        for name in ('Spicy', 'Dinner'):
+            first.tags.add(Tag.objects.create(user=self.user, name=name))
+        first.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice')
+        )
+        create_recipe(user=self.user, title='Toast', link='')
+
+    def _render(self, serializer_class, recipes, context=None):
+        """ Return the JSON bytes of serializing many recipes """
+        data = serializer_class(
+            recipes, many=True, context=context or {},
+        ).data
+        return JSONRenderer().render(data)
+
+    def test_rows_render_like_instances(self):
+        """ Test rows and instances give byte-identical JSON """
+        for serializer_class in (RecipeSerializer, RecipeDetailSerializer):
+            columns = ['updated_at', *serializer_class().selected_columns()]
+            queryset = Recipe.objects.order_by('-id')
+
+            expected = self._render(serializer_class, queryset)
+            with self.assertNumQueries(3):
+                actual = self._render(
+                    serializer_class,
+                    queryset.values(*columns),
+                )
+
+            self.assertEqual(actual, expected)
+
+    def test_list_endpoint_uses_rows(self):
+        """ Test the list endpoint answers what the serializer gives """
+        client = APIClient()
+        client.force_authenticate(self.user)
+        expected = self._render(
+            RecipeSerializer,
+            Recipe.objects.order_by('-id'),
+            {'request': Request(APIRequestFactory().get(RECIPES_URL))},
+        )
+
+        res = client.get(RECIPES_URL)
+
+        self.assertEqual(res.content, expected)
+
+
+class RecipeQueryCountTests(TestCase):
+    """ Test the number of queries used by the recipe endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def _create_recipes(self, count):
+        """ Create recipes that each have a tag and an ingredient """
+        recipes = []
+        for i in range(count):
+            recipe = create_recipe(user=self.user, title=f'recipe{i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'tag{i}')
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'ing{i}')
+            )
+            recipes.append(recipe)
+        return recipes
+
+    def test_list_query_count_is_constant(self):
+        """ Test listing recipes does not query per recipe """
+        self._create_recipes(10)
+
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 10)
+        self.assertEqual(len(res.data[0]['tags']), 1)
+        self.assertEqual(len(res.data[0]['ingredients']), 1)
+
+    def test_paginated_list_query_count(self):
+        """ Test a page of recipes does not query per recipe """
+        self._create_recipes(10)
+
+        with self.assertNumQueries(4):
+            res = self.client.get(RECIPES_URL, {'page_size': 5})
+
+        self.assertEqual(len(res.data['results']), 5)
+
+    def test_detail_query_count(self):
+        """ Test retrieving a recipe with its tags and ingredients """
+        recipe = self._create_recipes(1)[0]
+
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data['tags'][0]['name'], 'tag0')
+        self.assertEqual(res.data['ingredients'][0]['name'], 'ing0')
+
+    def test_create_query_count(self):
+        """ Test creating a recipe resolves names in bulk """
+        Tag.objects.create(user=self.user, name='tag0')
+        payload = {
+            'title': 'Stew',
+            'time_minutes': 60,
+            'price': Decimal('4.5'),
+            'tags': [{'name': f'tag{i}'} for i in range(10)],
+            'ingredients': [{'name': f'ing{i}'} for i in range(30)],
+        }
+
+        with self.assertNumQueries(14):
+            res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['tags']), 10)
+        self.assertEqual(len(res.data['ingredients']), 30)
+
+    def test_partial_update_query_count(self):
+        """ Test a title-only patch does not touch the relations """
+        recipe = self._create_recipes(1)[0]
+
+        with self.assertNumQueries(5):
+            res = self.client.patch(
+                detail_url(recipe.id),
+                {'title': 'New title'},
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['tags'][0]['name'], 'tag0')
+
+    def test_update_tags_writes_only_changes(self):
+        """ Test updating tags only inserts and deletes the difference """
+        recipe = self._create_recipes(1)[0]
+        Tag.objects.create(user=self.user, name='tag1')
+        payload = {'tags': [{'name': 'tag0'}, {'name': 'tag1'}]}
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id),
+                payload,
+                format='json',
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        through = Recipe.tags.through._meta.db_table
+        writes = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith((
+                f'INSERT INTO "{through}"',
+                f'DELETE FROM "{through}"',
+            ))
+        ]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+        self.assertEqual(recipe.tags.count(), 2)
+
+    def test_delete_query_count(self):
+        """ Test deleting a recipe does not prefetch its relations """
+        recipe = self._create_recipes(1)[0]
+
+        with self.assertNumQueries(4):
+            res = self.client.delete(detail_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
 
 class ImageUploadTest(TestCase):
     """ Test for the Image upload api """
@@ -452,6 +1374,48 @@ class ImageUploadTest(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def _upload(self, recipe, color='red'):
+        """ Upload a small JPEG to a recipe """
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10), color).save(image_file, format='JPEG')
+            image_file.seek(0)
+            res = self.client.post(
+                image_upload_url(recipe.id),
+                {'image': image_file},
+                format='multipart',
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+
+    def test_identical_uploads_share_file(self):
+        """ Test the same photo on two recipes is stored once """
+        other = create_recipe(user=self.user)
+        self._upload(self.recipe)
+        self._upload(other)
+
+        self.assertEqual(other.image.name, self.recipe.image.name)
+        blob = ImageBlob.objects.get(name=self.recipe.image.name)
+        self.assertEqual(blob.refcount, 2)
+
+        other.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+
+    def test_replaced_image_released(self):
+        """ Test replacing an image drops the reference to the old one """
+        self._upload(self.recipe, 'red')
+        old_name = self.recipe.image.name
+        self._upload(self.recipe, 'blue')
+        self.addCleanup(
+            self.recipe.image.storage.delete, old_name,
+        )
+
+        self.assertNotEqual(self.recipe.image.name, old_name)
+        self.assertEqual(ImageBlob.objects.get(name=old_name).refcount, 0)
+        self.assertEqual(
+            ImageBlob.objects.get(name=self.recipe.image.name).refcount, 1,
+        )
+
     def test_upload_image_bad_request(self):
         """ Test uploading invalid image """
         url = image_upload_url(self.recipe.id)
@@ -459,3 +1423,113 @@ class ImageUploadTest(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class ImageVariantTests(TestCase):
+    """ Test resized variants of uploaded images """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(
+            email='user@example.com',
+            password='password123',
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        storage = self.recipe.image.storage
+        for formats in self.recipe.image_variants.values():
+            for name in formats.values():
+                storage.delete(name)
+        self.recipe.image.delete()
+
+    def _upload(self, size, color='red'):
+        """ Upload a JPEG of the given size and run the commit hooks """
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', size, color).save(image_file, format='JPEG')
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(
+                    image_upload_url(self.recipe.id),
+                    {'image': image_file},
+                    format='multipart',
+                )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+
+    def test_variants_generated_after_upload(self):
+        """ Test smaller copies are written for each configured size """
+        self._upload((1500, 1000))
+
+        variants = self.recipe.image_variants
+        self.assertEqual(sorted(variants, key=int), ['128', '512', '1024'])
+        storage = self.recipe.image.storage
+        with storage.open(variants['512']['jpeg']) as variant:
+            self.assertEqual(max(Image.open(variant).size), 512)
+
+    def test_no_upscaled_variants(self):
+        """ Test sizes larger than the original are skipped """
+        self._upload((300, 200))
+
+        self.assertEqual(list(self.recipe.image_variants), ['128'])
+
+    def test_list_exposes_requested_size(self):
+        """ Test ?image_size= narrows the variants in the list """
+        self._upload((1500, 1000))
+
+        res = self.client.get(RECIPES_URL, {'image_size': 200})
+
+        variants = res.data[0]['image_variants']
+        self.assertEqual(list(variants), ['512'])
+        self.assertTrue(variants['512']['jpeg'].endswith('-512.jpeg'))
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data[0]['image_variants']), 3)
+
+    def test_variant_urls_absolute(self):
+        """ Test variant URLs are absolute, like the image URL """
+        self._upload((300, 200))
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        url = res.data['image_variants']['128']['jpeg']
+        self.assertTrue(url.startswith('http://testserver/'))
+
+    def test_replaced_image_variants_deleted(self):
+        """ Test uploading a new image deletes the old image's variants """
+        self._upload((300, 200))
+        old = self.recipe.image_variants['128']['jpeg']
+        storage = self.recipe.image.storage
+        self.addCleanup(storage.delete, self.recipe.image.name)
+
+        self._upload((300, 200), color='blue')
+
+        self.assertFalse(storage.exists(old))
+        self.assertTrue(
+            storage.exists(self.recipe.image_variants['128']['jpeg'])
+        )
+
+    def test_deleted_recipe_variants_deleted(self):
+        """ Test deleting a recipe deletes its image's variants """
+        self._upload((300, 200))
+        variant = self.recipe.image_variants['128']['jpeg']
+        storage = self.recipe.image.storage
+        self.addCleanup(storage.delete, self.recipe.image.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(storage.exists(variant))
+        # Give tearDown a recipe to refresh.
+        self.recipe = create_recipe(user=self.user)
+
+    @override_settings(IMAGE_VARIANT_FORMATS=['jpeg', 'heic'])
+    def test_unwritable_format_warned(self):
+        """ Test a format Pillow cannot write fails the system check """
+        warnings = check_variant_formats(None)
+
+        self.assertEqual([w.id for w in warnings], ['recipe.W001'])
+        self.assertIn("'heic'", warnings[0].msg)
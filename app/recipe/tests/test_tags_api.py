@@ -17,6 +17,7 @@ from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 def detail_url(tag_id):
     """ Create and return a tag detail url """
@@ -73,6 +74,19 @@ class PrivateTagsAPITest(TestCase):
         self.assertEqual(res.data[0]['name'], tag.name)
         self.assertEqual(res.data[0]['id'], tag.id)
 
+    def test_tags_cursor_pagination(self):
+        """ Test paging through tags with a cursor """
+        for name in ['a', 'b', 'c']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['name'] for t in res.data['results']], ['c', 'b'])
+        res = self.client.get(res.data['next'])
+        self.assertEqual([t['name'] for t in res.data['results']], ['a'])
+        self.assertIsNone(res.data['next'])
+
     def test_update_tag(self):
         """ Test updating a tag """
         tag = Tag.objects.create(user=self.user, name='Tagname')
@@ -85,6 +99,17 @@ class PrivateTagsAPITest(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload['name'])
 
+    def test_update_tag_to_existing_name_error(self):
+        """ Test renaming a tag onto another of the user's tags fails """
+        Tag.objects.create(user=self.user, name='Lunch')
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'Lunch'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dinner')
+
     def test_delete_tag(self):
         """ Test deleting a tag """
         tag = Tag.objects.create(user=self.user, name='Tagname')
@@ -141,3 +166,82 @@ class PrivateTagsAPITest(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_prefix(self):
+        """ Test completing tag names by a case-insensitive prefix """
+        for name in ['Dinner', 'dessert', 'Breakfast']:
+            Tag.objects.create(user=self.user, name=name)
+        user2 = create_user(email='user2@example.com')
+        Tag.objects.create(user=user2, name='Dim sum')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'd'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['name'] for t in res.data], ['dessert', 'Dinner'])
+
+    def test_autocomplete_fuzzy(self):
+        """ Test misspelled queries fall back to trigram matches """
+        tag = Tag.objects.create(user=self.user, name='Vegetarian')
+        Tag.objects.create(user=self.user, name='Lunch')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'vegetarain'})
+
+        self.assertEqual(res.data, [TagSerializer(tag).data])
+
+    def test_autocomplete_limit(self):
+        """ Test the number of completions can be limited """
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'tag{i}')
+
+        res = self.client.get(AUTOCOMPLETE_URL, {'q': 'tag', 'limit': 2})
+
+        self.assertEqual([t['name'] for t in res.data], ['tag0', 'tag1'])
+
+    def test_list_not_modified(self):
+        """ Test the tag list answers 304 until a tag changes """
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        etag = self.client.get(TAGS_URL)['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(detail_url(tag.id), {'name': 'Supper'})
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_assigned_list_changes_with_links(self):
+        """ Test swapping a recipe's tags changes the assigned-only list """
+        breakfast = Tag.objects.create(user=self.user, name='Breakfast')
+        dinner = Tag.objects.create(user=self.user, name='Dinner')
+        Tag.objects.filter(pk=dinner.pk).update(
+            updated_at=breakfast.updated_at,
+        )
+        recipe = Recipe.objects.create(
+            title='Porridge',
+            time_minutes=5,
+            price=Decimal('1.50'),
+            user=self.user,
+        )
+        recipe.tags.add(breakfast)
+        params = {'assigned_only': 1}
+        etag = self.client.get(TAGS_URL, params)['ETag']
+
+        recipe.tags.set([dinner])
+        res = self.client.get(TAGS_URL, params, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['name'] for t in res.data], ['Dinner'])
+
+    def test_list_fields(self):
+        """ Test the tag list can be limited to some fields """
+        obj = Tag.objects.create(user=self.user, name='Salt')
+
+        res = self.client.get(TAGS_URL, {'fields': 'id'})
+
+        self.assertEqual(res.data, [{'id': obj.id}])
+
+    def test_list_unknown_field(self):
+        """ Test unknown fields are rejected """
+        res = self.client.get(TAGS_URL, {'omit': 'secret'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
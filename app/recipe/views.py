@@ -12,16 +12,50 @@ from rest_framework import (
     status,
 )
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.db.models import Count, Exists, F, FloatField, Max, OuterRef
+from django.db.models.functions import Cast
+
 from core.models import (
+    SEARCH_CONFIG,
+    name_prefix_key,
     Recipe,
     Tag,
     Ingredient
 )
 from recipe import serializers
+from recipe.export import csv_lines, iter_recipes, ndjson_lines
+from recipe.images import schedule_variants
+from recipe.mixins import CachedListMixin, ConditionalGetMixin
+from user.authentication import CachedTokenAuthentication
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination,
+)
+
+
+SPARSE_FIELD_PARAMETERS = [
+    OpenApiParameter(
+        'fields',
+        OpenApiTypes.STR,
+        description='Comma separated fields to return, all by default.',
+    ),
+    OpenApiParameter(
+        'omit',
+        OpenApiTypes.STR,
+        description='Comma separated fields to leave out.',
+    ),
+]
 
 
 @extend_schema_view(
@@ -36,38 +70,130 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma seperated list of ingredient-IDs to filter '
-            )
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='Full-text search over title, description, tag '
+                'and ingredient names. Results are ordered by relevance.',
+            ),
+            OpenApiParameter(
+                'image_size',
+                OpenApiTypes.INT,
+                description='Only return the image variant closest to (and '
+                'at least) this width.',
+            ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR, enum=['any', 'all'],
+                description='Return recipes matching any (default) or all '
+                'of the requested tags and ingredients.',
+            ),
+            *SPARSE_FIELD_PARAMETERS,
+            OpenApiParameter(
+                'expand',
+                OpenApiTypes.STR, enum=['description'],
+                description='Comma separated detail fields to include.',
+            ),
         ]
-    )
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELD_PARAMETERS),
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    CachedListMixin,
+    ConditionalGetMixin,
+    viewsets.ModelViewSet,
+):
     """
        view for manage recipe APIs
     """
     serializer_class = serializers.RecipeDetailSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeCursorPagination
+    bulk_max_items = 1000
+    export_chunk_size = 2000
+    export_formats = {
+        'ndjson': (ndjson_lines, 'application/x-ndjson'),
+        'csv': (csv_lines, 'text/csv'),
+    }
 
     def _params_to_ints(self, qs):
         """ Conver a list of strings to integers. """
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _filter_related(self, queryset, field_name, ids, match_all):
+        """
+        Filter recipes on related ids with correlated EXISTS subqueries
+        against the through table, so no join or DISTINCT is needed.
+        """
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        if match_all:
+            for related_id in set(ids):
+                queryset = queryset.filter(Exists(through.objects.filter(
+                    **{source: OuterRef('pk'), target: related_id}
+                )))
+            return queryset
+        return queryset.filter(Exists(through.objects.filter(
+            **{source: OuterRef('pk'), f'{target}__in': ids}
+        )))
+
     def get_queryset(self):
         """ Retrieve recipes for authenticated user """
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': 'Must be "any" or "all".'})
+        match_all = match == 'all'
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_related(
+                queryset, 'tags', tag_ids, match_all,
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = self._filter_related(
+                queryset, 'ingredients', ingredient_ids, match_all,
+            )
 
-        return queryset.filter(
+        queryset = queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).defer('search_vector').order_by('-id')
+        search = self.request.query_params.get('search')
+        if search:
+            query = SearchQuery(
+                search,
+                config=SEARCH_CONFIG,
+                search_type='websearch',
+            )
+            # ts_rank is a real; as a double precision its cursor
+            # position prints and parses back to the exact same value.
+            queryset = queryset.filter(search_vector=query).annotate(
+                rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+            ).order_by('-rank', '-id')
+        if self.action in ('list', 'retrieve'):
+            # Load only what the (possibly ?fields= pruned) serializer
+            # reads, plus updated_at, the version of cached fragments.
+            serializer = self.get_serializer()
+            columns = ['updated_at', *serializer.selected_columns()]
+            queryset = queryset.only(*columns)
+        if self.action == 'list':
+            # Plain rows take the list serializer's fast path. Keep the
+            # annotations, the cursor paginator reads the rank.
+            queryset = queryset.values(*columns, *queryset.query.annotations)
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(*[
+                prefetch for prefetch in serializers.recipe_prefetches()
+                if prefetch.prefetch_to in serializer.fields
+            ])
+
+        return queryset
 
     def get_serializer_class(self):
         """
@@ -77,6 +203,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk' and self.request.method == 'DELETE':
+            return serializers.RecipeBulkDeleteSerializer
 
         return self.serializer_class
 
@@ -93,10 +221,205 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            recipe = serializer.save(image_variants={})
+            schedule_variants(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'output',
+                OpenApiTypes.STR,
+                enum=['ndjson', 'csv'],
+                description='Export format, ndjson by default. The list '
+                'filters (tags, ingredients, match, search) also apply.',
+            ),
+        ],
+        responses={(200, 'application/x-ndjson'): OpenApiTypes.STR},
+    )
+    @action(methods=['GET'], detail=False)
+    def export(self, request):
+        """ Stream all of the user's recipes as NDJSON or CSV """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.export_formats:
+            raise ValidationError({'output': 'Must be "ndjson" or "csv".'})
+        lines, content_type = self.export_formats[output]
+        recipes = iter_recipes(
+            self.filter_queryset(self.get_queryset()),
+            self.export_chunk_size,
+        )
+        response = StreamingHttpResponse(
+            lines(recipes),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{output}"'
+        )
+        return response
+
+    @action(methods=['POST', 'PATCH', 'DELETE'], detail=False)
+    def bulk(self, request):
+        """
+        Create (POST) or partially update (PATCH) a list of recipes, or
+        delete recipes by id (DELETE with {"ids": [...]}), in a single
+        transaction. Every item gets its own result; invalid items are
+        reported and skipped while the valid ones are written.
+        """
+        if request.method == 'DELETE':
+            return self._bulk_delete(request)
+
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': [
+                'Expected a list of items.'
+            ]})
+        if len(items) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [
+                f'At most {self.bulk_max_items} items are allowed.'
+            ]})
+        if request.method == 'POST':
+            return self._bulk_create(items)
+        return self._bulk_update(items)
+
+    def _bulk_create(self, items):
+        """ Validate and create recipes, returning per item results """
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                attrs = dict(serializer.validated_data, user=self.request.user)
+                valid.append((index, attrs))
+            else:
+                results[index] = {
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': serializer.errors,
+                }
+        if valid:
+            with transaction.atomic():
+                recipes = self.get_serializer(many=True).create(
+                    [attrs for _, attrs in valid]
+                )
+            data = self._bulk_representation(recipes)
+            for (index, _), item_data in zip(valid, data):
+                results[index] = {
+                    'status': status.HTTP_201_CREATED,
+                    'data': item_data,
+                }
+        return self._bulk_response(results, status.HTTP_201_CREATED)
+
+    def _bulk_update(self, items):
+        """ Validate and update recipes, returning per item results """
+        results = [None] * len(items)
+        ids = [
+            item.get('id') if isinstance(item, dict) else None
+            for item in items
+        ]
+        with transaction.atomic():
+            instances = self.get_queryset().filter(
+                pk__in=[pk for pk in ids if isinstance(pk, int)]
+            ).select_for_update().in_bulk()
+            valid = []
+            seen = set()
+            for index, (pk, item) in enumerate(zip(ids, items)):
+                if not isinstance(pk, int) or pk in seen:
+                    results[index] = {
+                        'status': status.HTTP_400_BAD_REQUEST,
+                        'errors': {'id': [
+                            'A unique recipe id is required.'
+                        ]},
+                    }
+                    continue
+                seen.add(pk)
+                if pk not in instances:
+                    results[index] = {
+                        'status': status.HTTP_404_NOT_FOUND,
+                        'errors': {'detail': 'Not found.'},
+                    }
+                    continue
+                serializer = self.get_serializer(
+                    instances[pk], data=item, partial=True,
+                )
+                if serializer.is_valid():
+                    valid.append(
+                        (index, instances[pk], serializer.validated_data)
+                    )
+                else:
+                    results[index] = {
+                        'status': status.HTTP_400_BAD_REQUEST,
+                        'errors': serializer.errors,
+                    }
+            if valid:
+                self.get_serializer(many=True).update(
+                    [instance for _, instance, _ in valid],
+                    [attrs for _, _, attrs in valid],
+                )
+        if valid:
+            data = self._bulk_representation(
+                [instance for _, instance, _ in valid]
+            )
+            for (index, _, _), item_data in zip(valid, data):
+                results[index] = {
+                    'status': status.HTTP_200_OK,
+                    'data': item_data,
+                }
+        return self._bulk_response(results, status.HTTP_200_OK)
+
+    def _bulk_delete(self, request):
+        """ Delete recipes by id, returning per id results """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if len(ids) > self.bulk_max_items:
+            raise ValidationError({'ids': [
+                f'At most {self.bulk_max_items} ids are allowed.'
+            ]})
+        with transaction.atomic():
+            queryset = self.get_queryset().filter(pk__in=ids)
+            found = set(queryset.values_list('pk', flat=True))
+            queryset.delete()
+        results = [
+            {'id': pk, 'status': status.HTTP_204_NO_CONTENT}
+            if pk in found else
+            {
+                'id': pk,
+                'status': status.HTTP_404_NOT_FOUND,
+                'errors': {'detail': 'Not found.'},
+            }
+            for pk in ids
+        ]
+        return self._bulk_response(results, status.HTTP_200_OK)
+
+    def _bulk_representation(self, recipes):
+        """ Serialize written recipes as they are now stored """
+        context = self.get_serializer_context()
+        columns = serializers.RecipeDetailSerializer(
+            context=context,
+        ).selected_columns()
+        stored = {
+            row['id']: row
+            for row in Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes],
+            ).values('updated_at', *columns)
+        }
+        serializer = serializers.RecipeDetailSerializer(
+            [stored[recipe.pk] for recipe in recipes],
+            many=True,
+            context=context,
+        )
+        return serializer.data
+
+    def _bulk_response(self, results, success_status):
+        """ Use 207 Multi-Status when some items failed """
+        failed = any(result['status'] >= 400 for result in results)
+        return Response(
+            {'results': results},
+            status=status.HTTP_207_MULTI_STATUS if failed else success_status,
+        )
+
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -104,30 +427,110 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 'assigned_only',
                 OpenApiTypes.INT, enum=[0,1],
                 description='Filter by items assigned to recipes.',
-            )
+            ),
+            *SPARSE_FIELD_PARAMETERS,
         ]
     )
 )
 class BaseRecipeAttrViewSet(
+    CachedListMixin,
+    ConditionalGetMixin,
     mixins.UpdateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
     viewsets.GenericViewSet):
     """ Base viewset for recipe attributes """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = RecipeAttrCursorPagination
+    autocomplete_max_limit = 50
+
+    def _assigned_only(self):
+        return bool(int(self.request.query_params.get('assigned_only', 0)))
+
+    def _recipe_links(self):
+        """ Return the through model to recipes and its column to us """
+        relation = self.queryset.model._meta.get_field('recipe')
+        return relation.through, relation.field.m2m_reverse_field_name()
 
     def get_queryset(self):
         """ Filter query set to authenticated users """
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
-        )
         queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+        if self._assigned_only():
+            through, column = self._recipe_links()
+            queryset = queryset.filter(Exists(through.objects.filter(
+                **{column: OuterRef('pk')}
+            )))
+        if self.action == 'list':
+            queryset = queryset.only(
+                'name', *self.get_serializer().selected_columns(),
+            )
         return queryset.filter(
             user=self.request.user
-            ).order_by('-name').distinct()
+            ).order_by('-name')
+
+    def get_extra_validators(self, queryset):
+        """
+        Assigned-only lists change with the recipe links, which leave the
+        rows themselves untouched. Link ids are never reused, so the count
+        and the latest id change with every link added or removed.
+        """
+        if not self._assigned_only():
+            return []
+        through, column = self._recipe_links()
+        stats = through.objects.filter(**{
+            f'{column}__in': queryset.order_by().values('pk'),
+        }).aggregate(count=Count('pk'), last=Max('pk'))
+        return [stats['count'], stats['last']]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'q',
+                OpenApiTypes.STR,
+                required=True,
+                description='Prefix or approximate name to complete.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Maximum number of names to return (max 50).',
+            ),
+        ]
+    )
+    @action(methods=['GET'], detail=False)
+    def autocomplete(self, request):
+        """
+        Return the best matching names for a prefix or fuzzy query.
+
+        Case-insensitive prefix matches come first, read in name order
+        straight from the (user, name prefix) index. Short lists are then
+        topped up with trigram matches ranked by similarity.
+        """
+        query = request.query_params.get('q', '').strip()
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer.'})
+        limit = max(1, min(limit, self.autocomplete_max_limit))
+        if not query:
+            return Response([])
+
+        queryset = self.get_queryset().only('id', 'name')
+        matches = list(
+            queryset.alias(key=name_prefix_key())
+            .filter(key__startswith=query.upper())
+            .order_by('key')[:limit]
+        )
+        if len(matches) < limit and len(query) >= 3:
+            matches += list(
+                queryset.filter(name__trigram_similar=query)
+                .exclude(id__in=[match.id for match in matches])
+                .annotate(similarity=TrigramSimilarity('name', query))
+                .order_by('-similarity', 'name')[:limit - len(matches)]
+            )
+        serializer = self.get_serializer(matches, many=True)
+        return Response(serializer.data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
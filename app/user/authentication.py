@@ -0,0 +1,131 @@
+# Authentication classes for the API
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LocalLRUCache:
+    """ A small thread-safe in-process LRU cache with a per-entry TTL """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the cached value, or None if missing or expired """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """ Store a value, evicting the least recently used entries """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """ Remove a value if present """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """ Remove every value """
+        with self._lock:
+            self._data.clear()
+
+
+class TokenUserCache:
+    """
+    Two level cache of token key to user.
+
+    Lookups hit a per-process LRU first and the shared Django cache
+    second. Deleting an entry clears both levels in this process and the
+    shared level everywhere; other processes drop their local copy when
+    its (short) local TTL runs out.
+    """
+
+    def __init__(self):
+        self.alias = getattr(settings, 'TOKEN_AUTH_CACHE_ALIAS', 'default')
+        self.timeout = getattr(settings, 'TOKEN_AUTH_CACHE_TIMEOUT', 300)
+        self.local = LocalLRUCache(
+            maxsize=getattr(settings, 'TOKEN_AUTH_LOCAL_CACHE_SIZE', 1024),
+            timeout=getattr(settings, 'TOKEN_AUTH_LOCAL_CACHE_TIMEOUT', 30),
+        )
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _cache_key(self, key):
+        """ Hash the token so raw keys never reach the cache backend """
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f'auth-token:{digest}'
+
+    def get(self, key):
+        """ Return the cached user for a token key, or None """
+        cache_key = self._cache_key(key)
+        user = self.local.get(cache_key)
+        if user is not None:
+            # Requests must not share (and mutate) one cached instance.
+            return copy.copy(user)
+        user = self.shared.get(cache_key)
+        if user is not None:
+            self.local.set(cache_key, copy.copy(user))
+        return user
+
+    def set(self, key, user):
+        """ Cache the user a token key resolves to """
+        cache_key = self._cache_key(key)
+        self.shared.set(cache_key, user, self.timeout)
+        self.local.set(cache_key, copy.copy(user))
+
+    def delete(self, key):
+        """ Forget a token key """
+        cache_key = self._cache_key(key)
+        self.shared.delete(cache_key)
+        self.local.delete(cache_key)
+
+    def clear(self):
+        """ Forget every cached token in this process """
+        self.local.clear()
+
+
+token_user_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that caches the
+    token-to-user lookup instead of querying both tables per request.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_user_cache.get(key)
+        if user is not None:
+            return (user, Token(key=key, user=user))
+
+        user, token = super().authenticate_credentials(key)
+        token_user_cache.set(key, user)
+        return (user, token)
@@ -0,0 +1,29 @@
+# Signal handlers for the user app
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user.authentication import token_user_cache
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    """ Stop authenticating with a deleted token """
+    token_user_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_tokens_of_saved_user(sender, instance, created, **kwargs):
+    """
+    Drop cached lookups when a user is saved, so deactivation, password
+    changes and profile edits are seen on the next request.
+    """
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        'key', flat=True,
+    ):
+        token_user_cache.delete(key)